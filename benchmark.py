@@ -0,0 +1,262 @@
+#!/usr/bin/python2
+
+"""
+Headless benchmark runner.
+
+Boots the game with SDL's dummy video and audio drivers and drives a
+Control through scripted scenarios, timing each phase of every frame
+(event_loop, update, draw and present). Frame time percentiles for each
+scenario are written as JSON so runs against different commits can be
+compared.
+
+    python benchmark.py --frames 600 --output before.json
+
+A session recorded with wordblaster.py --record can be played back in
+place of the scripted scenarios:
+
+    python benchmark.py --replay session.json --output before.json
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+from timeit import default_timer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+PHASES = ("event_loop", "update", "draw", "present")
+DIFFICULTIES = ("Easy", "Normal", "Hard", "Insane")
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Return frame time statistics in milliseconds."""
+    ordered = sorted(samples)
+    return {"p50": percentile(ordered, .5) * 1000,
+            "p90": percentile(ordered, .9) * 1000,
+            "p99": percentile(ordered, .99) * 1000,
+            "max": ordered[-1] * 1000 if ordered else 0.0,
+            "mean": sum(ordered) / len(ordered) * 1000 if ordered else 0.0}
+
+
+class Benchmark(object):
+    def __init__(self, frames, dt, wave_size, vectorized):
+        import pygame as pg
+        from data import prepare, tools, replay
+        from data.main import make_states
+        self.pg = pg
+        self.input = replay.INPUT
+        self.frames = frames
+        self.dt = dt
+        self.wave_size = wave_size
+        self.control = tools.Control(prepare.ORIGINAL_CAPTION)
+        self.control.setup_states(make_states(), "TITLE")
+        self.control.get_state("GAMEPLAY").vectorized_matching = vectorized
+        self.results = {}
+
+    def run_frames(self, name, frames, before_frame=None):
+        """Run frames frames, timing each phase, and store the summary
+        under name. Stops early if the game quits."""
+        control = self.control
+        samples = dict((phase, []) for phase in PHASES)
+        samples["total"] = []
+        for frame in range(frames):
+            if control.done:
+                break
+            if before_frame is not None:
+                before_frame(frame)
+            dt = self.input.frame_time(self.dt)
+            t0 = default_timer()
+            control.event_loop()
+            t1 = default_timer()
+            control.simulate(dt)
+            t2 = default_timer()
+            control.draw()
+            t3 = default_timer()
+            control.present()
+            t4 = default_timer()
+            for phase, start, end in zip(PHASES, (t0, t1, t2, t3), (t1, t2, t3, t4)):
+                samples[phase].append(end - start)
+            samples["total"].append(t4 - t0)
+        self.results[name] = {
+                "frames": len(samples["total"]),
+                "state": control.state_name,
+                "phases": dict((k, summarize(v)) for k, v in samples.items())}
+
+    def go_to(self, state_name, **persist):
+        """Finish the current state and flip to state_name."""
+        state = self.control.state
+        state.persist.update(persist)
+        state.next = state_name
+        state.done = True
+        self.control.update(self.dt)
+
+    def title_idle(self):
+        self.go_to("TITLE")
+        self.run_frames("title_idle", self.frames)
+
+    def gameplay(self, difficulty):
+        self.go_to("GAMEPLAY", difficulty=difficulty)
+        self.run_frames("gameplay_{}".format(difficulty.lower()), self.frames)
+
+    def wave(self):
+        """Spawn wave_size ships spread over the screen at once."""
+        self.go_to("GAMEPLAY", difficulty="Insane")
+        game = self.control.state
+        width, height = self.pg.display.get_surface().get_size()
+        for _ in range(self.wave_size):
+            game.add_random_word()
+        for word in game.words:
+            word.pos = (random.randint(width // 3, width),
+                        random.randint(80, height - 250))
+        self.run_frames("wave_{}".format(self.wave_size), self.frames)
+
+    def typing(self):
+        """Type an on-screen word and press enter in one frame, every
+        ten frames."""
+        self.go_to("GAMEPLAY", difficulty="Normal")
+        game = self.control.state
+        pg = self.pg
+        for _ in range(8):
+            game.add_random_word()
+
+        def type_word(frame):
+            if frame % 10 or not game.words:
+                return
+            word = random.choice(game.words.sprites()).word
+            for char in word:
+                pg.event.post(pg.event.Event(pg.KEYDOWN, key=ord(char),
+                              unicode=char, mod=0, scancode=0))
+            pg.event.post(pg.event.Event(pg.KEYDOWN, key=pg.K_RETURN,
+                          unicode="\r", mod=0, scancode=0))
+            if len(game.words) < 4:
+                game.add_random_word()
+
+        self.run_frames("typing", self.frames, type_word)
+
+    def replay(self, recording):
+        """Play back a recorded session from the start. The input must
+        already be set to play it before the Benchmark is made."""
+        from data import replay
+        self.run_frames("replay", len(recording))
+        checksum = replay.screen_checksum(self.control.screen)
+        self.results["replay"]["checksum"] = checksum
+        if recording.checksum is not None:
+            self.results["replay"]["matches_recording"] = checksum == recording.checksum
+        return self.results
+
+    def easing(self, samples=10000, resolution=1024):
+        """Time the analytic transitions against their lookup tables,
+        one value at a time and as NumPy arrays, and report each table's
+        measured maximum error."""
+        from data.components import animation
+        rng = random.Random(0)
+        progress = [rng.random() for _ in range(samples)]
+        report = {}
+        for name in animation.transition_names():
+            func = getattr(animation.AnimationTransition, name)
+            table = animation.TransitionTable(func, resolution)
+            result = {"max_error": table.max_error}
+            for label, f in (("analytic", func), ("table", table)):
+                start = default_timer()
+                for p in progress:
+                    f(p)
+                result[label + "_ns"] = (default_timer() - start) / samples * 1e9
+            if animation.np is not None:
+                #Small arrays like an AnimationManager's and one big one
+                vectors = (("analytic_array", animation.vectorize_transition(func)),
+                           ("table_array", table.vectorized))
+                for size in (16, samples):
+                    values = animation.np.array(progress[:size])
+                    repeats = samples // size
+                    for label, f in vectors:
+                        start = default_timer()
+                        for _ in range(repeats):
+                            f(values)
+                        elapsed = default_timer() - start
+                        key = "{}{}_ns".format(label, size)
+                        result[key] = elapsed / (repeats * size) * 1e9
+            report[name] = result
+        self.results["easing"] = {"samples": samples, "resolution": resolution,
+                                  "transitions": report}
+
+    def run(self, scenarios):
+        for scenario in scenarios:
+            if scenario == "gameplay":
+                for difficulty in DIFFICULTIES:
+                    self.gameplay(difficulty)
+            else:
+                getattr(self, scenario)()
+        return self.results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--frames", type=int, default=600,
+                        help="frames to run per scenario")
+    parser.add_argument("--dt", type=float, default=1000 / 60.,
+                        help="milliseconds of game time per frame")
+    parser.add_argument("--wave-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--vectorized", action="store_true",
+                        help="use the NumPy word matcher")
+    parser.add_argument("--scenario", action="append",
+                        choices=("title_idle", "gameplay", "wave", "typing",
+                                 "easing"),
+                        help="scenario to run, may be repeated (default all)")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play back a recorded session instead of the scenarios")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    random.seed(args.seed)
+    recording = None
+    if args.replay:
+        from data import replay
+        recording = replay.Recording.load(args.replay)
+        replay.INPUT.play(recording)
+    bench = Benchmark(args.frames, args.dt, args.wave_size, args.vectorized)
+    if recording is not None:
+        results = bench.replay(recording)
+    else:
+        scenarios = args.scenario or ["title_idle", "gameplay", "wave", "typing",
+                                      "easing"]
+        results = bench.run(scenarios)
+    import pygame as pg
+    from data import prepare
+    report = {"python": platform.python_version(),
+              "pygame": pg.version.ver,
+              "seed": recording.seed if recording is not None else args.seed,
+              "dt": args.dt,
+              "scenarios": results,
+              "assets": prepare.asset_report()}
+    if resource is not None:
+        report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit()
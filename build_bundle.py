@@ -0,0 +1,22 @@
+#!/usr/bin/python2
+
+"""Pack the decoded graphics and sounds in resources/ into
+resources/assets.bundle so the game can start without decoding them.
+Run it again after changing resources, a bundle that doesn't match them
+is ignored."""
+
+import os
+import sys
+
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+#Importing prepare sets the mixer up the way the game does, the bundled
+#samples have to be in that format.
+from data import prepare
+from data.components import bundle
+
+
+if __name__ == '__main__':
+    bundle.build_bundle()
+    sys.exit()
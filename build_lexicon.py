@@ -0,0 +1,13 @@
+#!/usr/bin/python2
+
+"""Compile the word list into resources/lexicon.idx ahead of time.
+The game builds the index on first run if it's missing or out of date,
+this just moves that cost out of the first game."""
+
+import sys
+from data.components import word_generator
+
+
+if __name__ == '__main__':
+    word_generator.build_index()
+    sys.exit()
@@ -1,10 +1,19 @@
 #https://github.com/bitcraft/animation
 from math import sqrt, cos, sin, pi
+from functools import partial
 import pygame
 import sys
+import os
+import weakref
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-__all__ = ('Task', 'Animation', 'remove_animations_of')
+
+__all__ = ('Task', 'Animation', 'AnimationManager', 'remove_animations_of',
+           'use_lookup_tables')
 
 
 
@@ -18,6 +27,11 @@ else:
     string_types = text_type = str
 
 
+#Animation keyword arguments that aren't attributes to tween
+ANIMATION_OPTIONS = ('duration', 'transition', 'round_values', 'delay',
+                     'initial')
+
+
 def remove_animations_of(group, target):
     """Find animations that target objects and remove those animations
 
@@ -25,6 +39,9 @@ def remove_animations_of(group, target):
     :param target: any
     :return: None
     """
+    if isinstance(group, AnimationManager):
+        group.cancel(target)
+        return
     animations = [ani for ani in group.sprites() if isinstance(ani, Animation)]
     to_remove = [ani for ani in animations if target in ani.targets]
     group.remove(*to_remove)
@@ -163,11 +180,17 @@ class Animation(pygame.sprite.Sprite):
     'round_values=True' to the constructor to avoid jitter caused
     by integer truncation.
     """
+    callback = None
+    update_callback = None
+
     def __init__(self, **kwargs):
         super(Animation, self).__init__()
         self.targets = None
-        self.delay = kwargs.get('delay', 0)
         self._started = False
+        self._configure(kwargs)
+
+    def _configure(self, kwargs):
+        self.delay = kwargs.get('delay', 0)
         self._round_values = kwargs.get('round_values', False)
         self._duration = float(kwargs.get('duration', 1000.))
         self._transition = kwargs.get('transition', 'linear')
@@ -175,8 +198,7 @@ class Animation(pygame.sprite.Sprite):
         if isinstance(self._transition, string_types):
             self._transition = getattr(AnimationTransition, self._transition)
         self._elapsed = 0.
-        for key in ('duration', 'transition', 'round_values', 'delay',
-                    'initial'):
+        for key in ANIMATION_OPTIONS:
             kwargs.pop(key, None)
         self.props = kwargs
 
@@ -253,7 +275,7 @@ class Animation(pygame.sprite.Sprite):
 
                 self._set_value(target, name, value)
 
-        if hasattr(self, 'update_callback'):
+        if self.update_callback is not None:
             self.update_callback()
 
         if p >= 1:
@@ -271,13 +293,17 @@ class Animation(pygame.sprite.Sprite):
                 for name, values in props.items():
                     a, b = values
                     self._set_value(target, name, b)
+        self._finished()
 
-        if hasattr(self, 'update_callback'):
+    def _finished(self):
+        """Call the callbacks and remove the animation, once its final
+        values have been set."""
+        if self.update_callback is not None:
             self.update_callback()
 
         self.targets = None
         self.kill()
-        if hasattr(self, 'callback'):
+        if self.callback is not None:
             self.callback()
 
     def start(self, sprite):
@@ -293,6 +319,279 @@ class Animation(pygame.sprite.Sprite):
             for name, value in self.props.items():
                 initial = self._get_value(target, name)
                 props[name] = initial, value
+        for group in self.groups():
+            if isinstance(group, AnimationManager):
+                group.started(self)
+
+    def retarget(self, **kwargs):
+        """Reuse a started Animation for a new tween of the same target
+
+        Takes the same arguments as the constructor. The tween starts
+        over from the target's current values, and any callback or
+        update_callback set on the Animation is removed.
+
+        :return: None
+        """
+        if self.targets is None:
+            raise ValueError("only a started Animation can be retargeted")
+        target = self.targets[0][0]
+        #Have batching managers save their timings now, so saving them
+        #when start invalidates them doesn't undo the reset below.
+        for group in self.groups():
+            if isinstance(group, AnimationManager):
+                group.invalidate()
+        self._configure(kwargs)
+        self.__dict__.pop('callback', None)
+        self.__dict__.pop('update_callback', None)
+        self.start(target)
+
+
+class AnimationManager(pygame.sprite.Group):
+    """Sprite group that updates its Animations together
+
+    Use it in place of a pygame.sprite.Group holding Animations and
+    Tasks. The start and end values of every tweened attribute, and the
+    elapsed time, duration and delay of every started Animation, are kept
+    in NumPy arrays. Each update advances all of them at once and
+    evaluates each transition once for all the Animations using it (see
+    VectorTransition), then writes the values to the targets.
+
+    Tasks, Animations that haven't been started and groups with fewer
+    than min_batch Animations are updated one by one, as is everything
+    if NumPy isn't installed. The arrays are rebuilt when the members
+    change; call invalidate after changing a member's targets.
+
+    All values are written before any update_callback is called, so
+    when two Animations change the same attribute the callbacks see the
+    value from the one added last.
+
+    Started Animations are also indexed by their targets, which are held
+    by weak reference, so animations_of, cancel and animate only look
+    at the Animations of the target they're given.
+    """
+    min_batch = 16
+
+    def __init__(self, *sprites):
+        self._batch = []
+        self._others = []
+        self._dirty = True
+        self._by_target = {}
+        self._target_keys = {}
+        super(AnimationManager, self).__init__(*sprites)
+
+    def add_internal(self, sprite, *args):
+        super(AnimationManager, self).add_internal(sprite, *args)
+        if isinstance(sprite, Animation) and sprite.targets is not None:
+            self._index(sprite)
+        self.invalidate()
+
+    def remove_internal(self, sprite):
+        self._unindex(sprite)
+        super(AnimationManager, self).remove_internal(sprite)
+        self.invalidate()
+
+    def started(self, animation):
+        """Called by a member Animation when it's started."""
+        self._index(animation)
+        self.invalidate()
+
+    def _index(self, animation):
+        self._unindex(animation)
+        keys = []
+        for target, _ in animation.targets:
+            key = id(target)
+            entry = self._by_target.get(key)
+            if entry is None or entry[0]() is not target:
+                try:
+                    ref = weakref.ref(target, partial(self._forget, key))
+                except TypeError:
+                    ref = partial(lambda obj: obj, target)
+                entry = self._by_target[key] = (ref, [])
+            entry[1].append(animation)
+            keys.append(key)
+        self._target_keys[animation] = keys
+
+    def _unindex(self, animation):
+        for key in self._target_keys.pop(animation, ()):
+            entry = self._by_target.get(key)
+            if entry is not None and animation in entry[1]:
+                entry[1].remove(animation)
+                if not entry[1]:
+                    del self._by_target[key]
+
+    def _forget(self, key, ref):
+        entry = self._by_target.get(key)
+        if entry is not None and entry[0] is ref:
+            del self._by_target[key]
+
+    def animations_of(self, target):
+        """Return a list of the started Animations of target."""
+        entry = self._by_target.get(id(target))
+        if entry is None or entry[0]() is not target:
+            return []
+        return list(entry[1])
+
+    def cancel(self, target, finish=False):
+        """Remove the Animations of target, setting their final values
+        first if finish is True.
+
+        :return: None
+        """
+        for ani in self.animations_of(target):
+            if finish:
+                ani.finish()
+            else:
+                self.remove(ani)
+
+    def animate(self, target, **kwargs):
+        """Tween attributes of target, replacing any tweens of them
+
+        Takes the same arguments as Animation. If an Animation of target
+        tweens exactly the same attributes it is retargeted (see
+        Animation.retarget) rather than making a new one. Otherwise the
+        attributes are dropped from the Animations of target that tween
+        them, and a new Animation is started and added.
+
+        :return: The Animation
+        """
+        names = set(kwargs) - set(ANIMATION_OPTIONS)
+        running = self.animations_of(target)
+        for ani in running:
+            if len(ani.targets) == 1 and set(ani.props) == names:
+                ani.retarget(**kwargs)
+                return ani
+        for ani in running:
+            shared = names.intersection(ani.props)
+            if not shared:
+                continue
+            if shared == set(ani.props):
+                self.remove(ani)
+                continue
+            for name in shared:
+                del ani.props[name]
+                for _, props in ani.targets:
+                    props.pop(name, None)
+            self.invalidate()
+        ani = Animation(**kwargs)
+        ani.start(target)
+        self.add(ani)
+        return ani
+
+    def invalidate(self):
+        """Rebuild the arrays before the next update."""
+        if not self._dirty:
+            self._store()
+            self._dirty = True
+
+    def _store(self):
+        """Copy the batched timings back to their Animations."""
+        if self._batch:
+            for ani, elapsed, delay in zip(self._batch, self._elapsed.tolist(),
+                                           self._delay.tolist()):
+                ani._elapsed = elapsed
+                ani.delay = delay
+
+    def _rebuild(self):
+        self._dirty = False
+        batch, others = [], []
+        for sprite in self.sprites():
+            if isinstance(sprite, Animation) and sprite.targets is not None:
+                batch.append(sprite)
+            else:
+                others.append(sprite)
+        if np is None or len(batch) < self.min_batch:
+            self._batch, self._others = [], batch + others
+            return
+        rows, starts, ends, owners = [], [], [], []
+        transitions = {}
+        for i, ani in enumerate(batch):
+            transitions.setdefault(ani._transition, []).append(i)
+            for target, props in ani.targets:
+                for name, (a, b) in props.items():
+                    attr = getattr(target, name)
+                    setter = attr if callable(attr) else None
+                    rows.append((target, name, setter, ani._round_values))
+                    starts.append(a)
+                    ends.append(b)
+                    owners.append(i)
+        self._batch, self._others = batch, others
+        self._rows = rows
+        self._end_values = ends
+        self._starts = np.array(starts, dtype=float)
+        self._ends = np.array(ends, dtype=float)
+        self._owners = np.array(owners, dtype=int)
+        self._elapsed = np.array([ani._elapsed for ani in batch], dtype=float)
+        self._duration = np.array([ani._duration for ani in batch], dtype=float)
+        self._delay = np.array([ani.delay for ani in batch], dtype=float)
+        self._transitions = [(vectorize_transition(func), np.array(indices))
+                             for func, indices in transitions.items()]
+
+    def update(self, dt):
+        """Update every member
+
+        :param dt: Time passed since last update.
+        """
+        if self._dirty:
+            self._rebuild()
+        for sprite in self._others:
+            sprite.update(dt)
+        if not self._batch:
+            return
+        batch = self._batch
+        elapsed, delay = self._elapsed, self._delay
+        elapsed += dt
+        running = None
+        if delay.any():
+            begun = (delay > 0) & (elapsed >= delay)
+            elapsed[begun] -= delay[begun]
+            delay[begun] = 0
+            running = delay <= 0
+        progress = np.minimum(1., elapsed / self._duration)
+        eased = np.empty_like(progress)
+        for func, indices in self._transitions:
+            eased[indices] = func(progress[indices])
+
+        t = eased[self._owners]
+        values = (self._starts * (1. - t) + self._ends * t).tolist()
+        if running is None:
+            changed = range(len(values))
+            updated = batch
+            done = np.flatnonzero(progress >= 1)
+        else:
+            changed = np.flatnonzero(running[self._owners]).tolist()
+            updated = [ani for ani, run in zip(batch, running.tolist()) if run]
+            done = np.flatnonzero((progress >= 1) & running)
+        rows = self._rows
+        #Finished Animations get their end values here rather than from
+        #finish, so a later member tweening the same attribute still wins.
+        final = None
+        if len(done):
+            final = (progress >= 1)[self._owners].tolist()
+            end_values = self._end_values
+        for i in changed:
+            target, name, setter, round_values = rows[i]
+            if final is not None and final[i]:
+                value = end_values[i]
+            else:
+                value = values[i]
+                if round_values:
+                    value = int(round(value, 0))
+            if setter is None:
+                setattr(target, name, value)
+            else:
+                setter(value)
+
+        for ani in updated:
+            if ani.update_callback is not None:
+                ani.update_callback()
+        if len(done):
+            self._store()
+            for i in done.tolist():
+                if self.has(batch[i]):
+                    batch[i]._finished()
+        elif self._dirty:
+            #Members changed during the update, keep this update's timings
+            self._store()
 
 
 class AnimationTransition(object):
@@ -573,3 +872,293 @@ class AnimationTransition(object):
             return AnimationTransition._in_bounce_internal(p, 1.) * .5
         return AnimationTransition._out_bounce_internal(p - 1., 1.) * .5 + .5
 
+
+class VectorTransition(object):
+    """NumPy versions of the AnimationTransition functions, taking and
+    returning arrays of progress values. Both sides of each branch are
+    computed for every value and the right one picked with where.
+    """
+
+    @staticmethod
+    def linear(p):
+        return p
+
+    @staticmethod
+    def in_quad(p):
+        return p * p
+
+    @staticmethod
+    def out_quad(p):
+        return -1.0 * p * (p - 2.0)
+
+    @staticmethod
+    def in_out_quad(p):
+        q = p * 2
+        r = q - 1.0
+        return np.where(q < 1, 0.5 * q * q, -0.5 * (r * (r - 2.0) - 1.0))
+
+    @staticmethod
+    def in_cubic(p):
+        return p * p * p
+
+    @staticmethod
+    def out_cubic(p):
+        q = p - 1.0
+        return q * q * q + 1.0
+
+    @staticmethod
+    def in_out_cubic(p):
+        q = p * 2
+        r = q - 2
+        return np.where(q < 1, 0.5 * q * q * q, 0.5 * (r * r * r + 2.0))
+
+    @staticmethod
+    def in_quart(p):
+        return p * p * p * p
+
+    @staticmethod
+    def out_quart(p):
+        q = p - 1.0
+        return -1.0 * (q * q * q * q - 1.0)
+
+    @staticmethod
+    def in_out_quart(p):
+        q = p * 2
+        r = q - 2
+        return np.where(q < 1, 0.5 * q * q * q * q, -0.5 * (r * r * r * r - 2.0))
+
+    @staticmethod
+    def in_quint(p):
+        return p * p * p * p * p
+
+    @staticmethod
+    def out_quint(p):
+        q = p - 1.0
+        return q * q * q * q * q + 1.0
+
+    @staticmethod
+    def in_out_quint(p):
+        q = p * 2
+        r = q - 2.0
+        return np.where(q < 1, 0.5 * q * q * q * q * q,
+                        0.5 * (r * r * r * r * r + 2.0))
+
+    @staticmethod
+    def in_sine(p):
+        return -1.0 * np.cos(p * (pi / 2.0)) + 1.0
+
+    @staticmethod
+    def out_sine(p):
+        return np.sin(p * (pi / 2.0))
+
+    @staticmethod
+    def in_out_sine(p):
+        return -0.5 * (np.cos(pi * p) - 1.0)
+
+    @staticmethod
+    def in_expo(p):
+        return np.where(p == 0, 0.0, np.power(2., 10 * (p - 1.0)))
+
+    @staticmethod
+    def out_expo(p):
+        return np.where(p == 1.0, 1.0, -np.power(2., -10 * p) + 1.0)
+
+    @staticmethod
+    def in_out_expo(p):
+        q = p * 2
+        value = np.where(q < 1, 0.5 * np.power(2., 10 * (q - 1.0)),
+                         0.5 * (-np.power(2., -10 * (q - 1.0)) + 2.0))
+        return np.where(p == 0, 0.0, np.where(p == 1., 1.0, value))
+
+    @staticmethod
+    def in_circ(p):
+        return -1.0 * (np.sqrt(np.maximum(0., 1.0 - p * p)) - 1.0)
+
+    @staticmethod
+    def out_circ(p):
+        q = p - 1.0
+        return np.sqrt(np.maximum(0., 1.0 - q * q))
+
+    @staticmethod
+    def in_out_circ(p):
+        q = p * 2
+        r = q - 2.0
+        return np.where(q < 1, -0.5 * (np.sqrt(np.maximum(0., 1.0 - q * q)) - 1.0),
+                        0.5 * (np.sqrt(np.maximum(0., 1.0 - r * r)) + 1.0))
+
+    @staticmethod
+    def in_elastic(p):
+        period = .3
+        s = period / 4.0
+        q = p - 1.0
+        value = -(np.power(2., 10 * q) * np.sin((q - s) * (2 * pi) / period))
+        return np.where(p == 1, 1.0, value)
+
+    @staticmethod
+    def out_elastic(p):
+        period = .3
+        s = period / 4.0
+        value = np.power(2., -10 * p) * np.sin((p - s) * (2 * pi) / period) + 1.0
+        return np.where(p == 1, 1.0, value)
+
+    @staticmethod
+    def in_out_elastic(p):
+        period = .3 * 1.5
+        s = period / 4.0
+        q = p * 2 - 1.0
+        wave = np.sin((q - s) * (2.0 * pi) / period)
+        value = np.where(q < 0, -.5 * (np.power(2., 10 * q) * wave),
+                         np.power(2., -10 * q) * wave * .5 + 1.0)
+        return np.where(p == 1, 1.0, value)
+
+    @staticmethod
+    def in_back(p):
+        return p * p * ((1.70158 + 1.0) * p - 1.70158)
+
+    @staticmethod
+    def out_back(p):
+        q = p - 1.0
+        return q * q * ((1.70158 + 1) * q + 1.70158) + 1.0
+
+    @staticmethod
+    def in_out_back(p):
+        q = p * 2.
+        r = q - 2.0
+        s = 1.70158 * 1.525
+        return np.where(q < 1, 0.5 * (q * q * ((s + 1.0) * q - s)),
+                        0.5 * (r * r * ((s + 1.0) * r + s) + 2.0))
+
+    @staticmethod
+    def out_bounce(p):
+        conditions = [p < (1.0 / 2.75), p < (2.0 / 2.75), p < (2.5 / 2.75)]
+        a = p - (1.5 / 2.75)
+        b = p - (2.25 / 2.75)
+        c = p - (2.625 / 2.75)
+        choices = [7.5625 * p * p, 7.5625 * a * a + .75, 7.5625 * b * b + .9375]
+        return np.select(conditions, choices, 7.5625 * c * c + .984375)
+
+    @staticmethod
+    def in_bounce(p):
+        return 1.0 - VectorTransition.out_bounce(1. - p)
+
+    @staticmethod
+    def in_out_bounce(p):
+        q = p * 2.
+        return np.where(q < 1., VectorTransition.in_bounce(q) * .5,
+                        VectorTransition.out_bounce(q - 1.) * .5 + .5)
+
+
+def vectorize_transition(func):
+    """Return the VectorTransition matching an AnimationTransition
+    function, or its TransitionTable if lookup tables are in use for it,
+    or a function applying func to each value of an array for any other
+    callable."""
+    if isinstance(func, TransitionTable):
+        return func.vectorized
+    name = getattr(func, "__name__", None)
+    if (name is not None and not name.startswith("_") and
+            getattr(AnimationTransition, name, None) is func):
+        table = LOOKUP_TABLES.get(name)
+        if table is not None:
+            return table.vectorized
+        return getattr(VectorTransition, name)
+    return lambda progress: np.array([func(p) for p in progress.tolist()],
+                                     dtype=float)
+
+
+class TransitionTable(object):
+    """A transition sampled at resolution + 1 evenly spaced points
+
+    vectorized interpolates linearly between the two nearest samples
+    instead of evaluating the transition, so it costs the same for every
+    transition. That only pays off for arrays of the expensive ones; a
+    single value looked up from Python costs more than calling the
+    function, so Animations updated one at a time never use tables.
+    0 and 1 are sampled exactly, so Animations still start and end on
+    their exact values.
+
+    Error bound: for a transition with a continuous second derivative
+    the error is at most max|f''| / (8 * resolution ** 2). Where that
+    doesn't hold the error is set by a single interval instead: the
+    expo and elastic transitions jump by up to 0.001 at 0 or 1, the
+    bounce transitions have corners and the circ transitions are
+    vertical at one end, so their error only shrinks with the square
+    root of the resolution. max_error measures the actual worst case by
+    checking 16 points in every interval. At the default resolution of
+    1024 the measured maximum errors are:
+
+        circ family                        0.011
+        bounce family                      0.0019
+        expo family                        0.00092
+        elastic family                     0.00046
+        quad/cubic/quart/quint/back/sine   0.000005
+
+    so a 100 pixel tween is at most about a pixel off, and under a
+    thousandth of a pixel for the smooth transitions.
+    """
+    def __init__(self, func, resolution=1024):
+        self.func = func
+        self.__name__ = getattr(func, "__name__", "transition")
+        self.resolution = resolution
+        step = 1. / resolution
+        self.values = [float(func(i * step)) for i in range(resolution)]
+        self.values.append(float(func(1.)))
+        if np is not None:
+            self.points = np.linspace(0., 1., resolution + 1)
+            self.array = np.array(self.values)
+        self._max_error = None
+
+    def __call__(self, progress):
+        x = progress * self.resolution
+        i = int(x)
+        if i >= self.resolution:
+            return self.values[-1]
+        a = self.values[i]
+        return a + (self.values[i + 1] - a) * (x - i)
+
+    def vectorized(self, progress):
+        """Interpolate an array of progress values, see VectorTransition."""
+        return np.interp(progress, self.points, self.array)
+
+    @property
+    def max_error(self):
+        """Largest difference from the transition found by checking 16
+        points in every interval of the table."""
+        if self._max_error is None:
+            checks = self.resolution * 16
+            progress = [i / float(checks) for i in range(checks + 1)]
+            self._max_error = max(abs(self(p) - self.func(p)) for p in progress)
+        return self._max_error
+
+
+#TransitionTables used by AnimationManager in place of VectorTransition
+#functions, see use_lookup_tables.
+LOOKUP_TABLES = {}
+
+#Families of transitions expensive enough that a table is faster.
+TABULATED = ("elastic", "bounce", "back")
+
+
+def transition_names():
+    """Names of the AnimationTransition functions."""
+    return [name for name in dir(AnimationTransition)
+            if not name.startswith("_")]
+
+
+def use_lookup_tables(resolution=1024):
+    """Make AnimationManagers batch the elastic, bounce and back
+    transitions with TransitionTables sampled at resolution. Managers
+    pick this up the next time they rebuild their batch. A resolution of
+    0 goes back to evaluating the transitions. Setting the
+    WORDBLASTER_EASING_LUT environment variable to a resolution does this
+    when the module is imported."""
+    LOOKUP_TABLES.clear()
+    if resolution:
+        for name in transition_names():
+            if name.endswith(TABULATED):
+                LOOKUP_TABLES[name] = TransitionTable(
+                        getattr(AnimationTransition, name), resolution)
+
+
+if os.environ.get("WORDBLASTER_EASING_LUT"):
+    use_lookup_tables(int(os.environ["WORDBLASTER_EASING_LUT"]))
@@ -0,0 +1,175 @@
+"""
+A single packed file holding the game's graphics and sounds already
+decoded, so starting the game doesn't open and decode each PNG and OGG.
+
+The bundle is made by build_bundle.py. It starts with a header and an
+index of entries, followed by the raw RGB/RGBA pixels of each image and
+the PCM samples of each sound in the mixer's format. The file is
+memory-mapped and assets are copied out of it when they're loaded.
+
+A bundle records a fingerprint of the resources folder and the mixer
+settings it was built with. If either doesn't match, open_bundle returns
+None and the assets are loaded from their files as usual; the same
+happens for any asset that isn't in the bundle. The fingerprint is the
+one the SurfaceCache uses, so resources/ is only walked once per run.
+"""
+
+import os
+import mmap
+import struct
+
+import pygame as pg
+
+from .. import tools
+from .surface_cache import fingerprint, RESOURCES_DIR
+
+
+VERSION = 1
+BUNDLE_PATH = os.path.join(RESOURCES_DIR, "assets.bundle")
+MAGIC = b"WBAB"
+
+#magic, version, entry count, mixer frequency, size and channels,
+#resources fingerprint
+HEADER = struct.Struct("<4sHIIhH32s")
+#kind, name length, width, height, offset, length; followed by the name
+ENTRY = struct.Struct("<BHIIQQ")
+
+RGB, RGBA, SOUND = 0, 1, 2
+FORMATS = {RGB: "RGB", RGBA: "RGBA"}
+
+IMAGE_TYPES = (".png", ".jpg", ".bmp")
+SOUND_TYPES = (".wav", ".ogg")
+
+
+def _key(path):
+    return os.path.normpath(path).replace(os.sep, "/")
+
+
+def _sources(resources_dir):
+    """Yield (path, kind) for every image and sound to be bundled."""
+    for folder, accept in (("graphics", IMAGE_TYPES), ("sound", SOUND_TYPES)):
+        directory = os.path.join(resources_dir, folder)
+        for name in sorted(os.listdir(directory)):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in accept:
+                yield os.path.join(directory, name), accept is SOUND_TYPES
+
+
+def build_bundle(bundle_path=BUNDLE_PATH, resources_dir=RESOURCES_DIR):
+    """Decode the graphics and sounds in resources_dir and pack them into
+    bundle_path. The mixer must already be initialized with the settings
+    the game uses."""
+    mixer = pg.mixer.get_init()
+    if mixer is None:
+        raise RuntimeError("the mixer must be initialized to build a bundle")
+    entries = []
+    for path, is_sound in _sources(resources_dir):
+        if is_sound:
+            data = pg.mixer.Sound(path).get_raw()
+            entries.append((SOUND, _key(path), 0, 0, data))
+        else:
+            img = pg.image.load(path)
+            kind = RGBA if img.get_alpha() else RGB
+            data = pg.image.tostring(img, FORMATS[kind])
+            width, height = img.get_size()
+            entries.append((kind, _key(path), width, height, data))
+
+    names = [name.encode("utf-8") for _, name, _, _, _ in entries]
+    position = HEADER.size + sum(ENTRY.size + len(n) for n in names)
+    index = []
+    for (kind, _, width, height, data), name in zip(entries, names):
+        index.append(ENTRY.pack(kind, len(name), width, height,
+                                position, len(data)) + name)
+        position += len(data)
+    frequency, size, channels = mixer
+    header = HEADER.pack(MAGIC, VERSION, len(entries), frequency, size,
+                         channels, fingerprint(resources_dir).encode("ascii"))
+
+    temp_path = bundle_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(b"".join(index))
+        for entry in entries:
+            f.write(entry[4])
+    if os.path.exists(bundle_path):
+        os.remove(bundle_path)
+    os.rename(temp_path, bundle_path)
+
+
+class AssetBundle(object):
+    """A memory-mapped bundle. Assets are looked up by their file path."""
+    def __init__(self, path=BUNDLE_PATH):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.version, count, frequency, size, channels,
+         self.fingerprint) = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("{} is not an asset bundle".format(path))
+        self.mixer = (frequency, size, channels)
+        self.entries = {}
+        position = HEADER.size
+        for _ in range(count):
+            kind, name_size, width, height, offset, length = ENTRY.unpack_from(
+                    self.data, position)
+            position += ENTRY.size
+            name = self.data[position:position + name_size].decode("utf-8")
+            position += name_size
+            self.entries[name] = (kind, width, height, offset, length)
+
+    def is_current(self, resources_dir=RESOURCES_DIR):
+        """Whether the bundle matches this build, the resources on disk
+        and the running mixer."""
+        return (self.version == VERSION and
+                self.fingerprint.decode("ascii") == fingerprint(resources_dir) and
+                (pg.mixer.get_init() is None or pg.mixer.get_init() == self.mixer))
+
+    def listing(self, directory):
+        """Return {name: path} for the assets in directory, like
+        tools.load_all_music does for files."""
+        prefix = _key(directory) + "/"
+        found = {}
+        for key in self.entries:
+            if key.startswith(prefix) and "/" not in key[len(prefix):]:
+                name = os.path.splitext(key[len(prefix):])[0]
+                found[name] = os.path.join(directory, key[len(prefix):])
+        return found
+
+    def _bytes(self, entry):
+        offset, length = entry[3], entry[4]
+        return self.data[offset:offset + length]
+
+    def load_image(self, path, colorkey=(0,0,0)):
+        """Like tools.load_image but from the bundle, falling back to the
+        file if the image isn't bundled."""
+        entry = self.entries.get(_key(path))
+        if entry is None or entry[0] not in FORMATS:
+            return tools.load_image(path, colorkey)
+        kind, width, height = entry[:3]
+        img = pg.image.frombuffer(self._bytes(entry), (width, height), FORMATS[kind])
+        if kind == RGBA:
+            return img.convert_alpha()
+        img = img.convert()
+        img.set_colorkey(colorkey)
+        return img
+
+    def load_sound(self, path):
+        """Return a Sound from the bundled samples, or from the file if
+        the sound isn't bundled."""
+        entry = self.entries.get(_key(path))
+        if entry is None or entry[0] != SOUND:
+            return pg.mixer.Sound(path)
+        return pg.mixer.Sound(buffer=self._bytes(entry))
+
+
+def open_bundle(path=BUNDLE_PATH, resources_dir=RESOURCES_DIR):
+    """Return the AssetBundle at path if there is one and it's current,
+    otherwise None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        bundle = AssetBundle(path)
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+    if not bundle.is_current(resources_dir):
+        return None
+    return bundle
@@ -1,13 +1,20 @@
+import random
+import hashlib
 from random import randint
-from itertools import cycle
-from math import pi, degrees
+from math import pi
 
 import pygame as pg
 
-from .. import tools, prepare
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .. import tools, prepare, replay
 from ..components.labels import Label
-from ..components.animation import Animation
+from ..components.animation import AnimationManager
 from ..components.angles import get_angle
+from ..components.surface_cache import SURFACE_CACHE
 
 
 class Star(object):
@@ -17,8 +24,10 @@ class Star(object):
     twinkle_range = (200, 2000)
     def __init__(self, pos):
         self.pos = pos
+        self.rect = pg.Rect(self.pos, (2, 2))
         self.ticks = randint(0, 4)
         self.frequency = randint(*self.twinkle_range)
+        self.twinkling = False
         
     def update(self, dt):
         self.ticks += 1
@@ -29,12 +38,269 @@ class Star(object):
  
     def move(self, offset):
         self.pos = (self.pos[0], self.pos[1] - offset[1])
+        self.rect.topleft = self.pos
+
+    @property
+    def twinkle_rect(self):
+        """The area covered by the star while it twinkles."""
+        return self.rect.inflate(2, 2)
         
     def draw(self, surface):
-        twinkler = pg.Rect(self.pos, (2, 2))
         if self.twinkling:
-            surface.blit(self.twinkle, (twinkler.left - 1, twinkler.top - 1))
-        pg.draw.rect(surface, pg.Color("lightcyan"), twinkler)
+            surface.blit(self.twinkle, (self.rect.left - 1, self.rect.top - 1))
+        pg.draw.rect(surface, pg.Color("lightcyan"), self.rect)
+
+
+class StarList(object):
+    """A list of Star objects behind the same interface as Starfield."""
+    def __init__(self, screen_rect, num_stars):
+        self.stars = [Star((randint(1, screen_rect.right),
+                            randint(1, screen_rect.bottom - 150)))
+                      for _ in range(num_stars)]
+
+    def __len__(self):
+        return len(self.stars)
+
+    def update(self, dt):
+        for star in self.stars:
+            star.update(dt)
+
+    def move(self, offset):
+        for star in self.stars:
+            star.move(offset)
+
+    def draw_stars(self, surface):
+        color = pg.Color("lightcyan")
+        for star in self.stars:
+            surface.fill(color, star.rect)
+
+    def twinkle_rects(self):
+        return [star.twinkle_rect for star in self.stars if star.twinkling]
+
+    def draw_twinkles(self, surface):
+        for star in self.stars:
+            if star.twinkling:
+                star.draw(surface)
+
+
+class Starfield(object):
+    """
+    Stars stored as NumPy arrays of positions, tick counters and twinkle
+    frequencies. Twinkles are updated for every star in one vectorized
+    step and drawn with a single Surface.blits call, so the cost of a
+    frame depends on how many stars twinkle rather than how many there
+    are. Behaves like a list of Star objects. The random generator is
+    seeded from the random module, so seeding that makes the starfield
+    reproducible.
+    """
+    def __init__(self, screen_rect, num_stars):
+        self.rng = np.random.RandomState(random.getrandbits(32))
+        low, high = Star.twinkle_range
+        self.x = self.rng.randint(1, screen_rect.right + 1, num_stars)
+        self.y = self.rng.randint(1, screen_rect.bottom - 149, num_stars)
+        self.ticks = self.rng.randint(0, 5, num_stars)
+        self.frequency = self.rng.randint(low, high + 1, num_stars)
+        self.twinkling = np.zeros(num_stars, dtype=bool)
+
+    def __len__(self):
+        return len(self.x)
+
+    def update(self, dt):
+        self.ticks += 1
+        self.twinkling = (self.ticks % self.frequency) == 0
+        num = np.count_nonzero(self.twinkling)
+        if num:
+            low, high = Star.twinkle_range
+            self.frequency[self.twinkling] = self.rng.randint(low, high + 1, num)
+
+    def move(self, offset):
+        self.y -= int(offset[1])
+
+    def draw_stars(self, surface):
+        """Draw every star (without twinkles) straight into the pixels
+        of surface."""
+        color = surface.map_rgb(pg.Color("lightcyan"))
+        w, h = surface.get_size()
+        try:
+            pixels = pg.surfarray.pixels2d(surface)
+        except ValueError:
+            for x, y in zip(self.x, self.y):
+                surface.fill(color, (int(x), int(y), 2, 2))
+            return
+        for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            xs, ys = self.x + dx, self.y + dy
+            visible = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+            pixels[xs[visible], ys[visible]] = color
+        del pixels
+
+    def twinkle_rects(self):
+        indices = np.flatnonzero(self.twinkling)
+        return [pg.Rect(int(self.x[i]) - 1, int(self.y[i]) - 1, 4, 4)
+                for i in indices]
+
+    def draw_twinkles(self, surface):
+        indices = np.flatnonzero(self.twinkling)
+        if not len(indices):
+            return
+        surface.blits([(Star.twinkle, (int(self.x[i]) - 1, int(self.y[i]) - 1))
+                       for i in indices], False)
+        color = pg.Color("lightcyan")
+        for i in indices:
+            surface.fill(color, (int(self.x[i]), int(self.y[i]), 2, 2))
+
+
+class Background(object):
+    """
+    The starfield and hills, and the dashboard for states that show it,
+    pre-composited onto a single layer. The layer is built the first time
+    it's drawn and only rebuilt when the screen size changes, the stars
+    move or invalidate is called. Each frame only
+    the areas drawn over in the previous frame are restored from the
+    layer (all of it when there's no DirtyRects to go by or the screen
+    needs a full redraw) and the stars that are twinkling are drawn on
+    top. Uses a NumPy Starfield when NumPy is available.
+    """
+    num_stars = 100
+
+    def __init__(self, screen_rect, num_stars=None):
+        if num_stars is None:
+            num_stars = self.num_stars
+        if np is not None:
+            self.stars = Starfield(screen_rect, num_stars)
+        else:
+            self.stars = StarList(screen_rect, num_stars)
+        self.hills = prepare.GFX["hills"]
+        self.hills_rect = self.hills.get_rect()
+        self.dashboard = None
+        self.dash_rect = None
+        #Layers keyed by whether they include the dashboard
+        self.layers = {}
+        self.layer = None
+
+    def invalidate(self):
+        """Throw away the layers so they're rebuilt on the next draw."""
+        self.layers = {}
+        self.layer = None
+
+    def make_layer(self, size, dashboard=False):
+        layer = pg.Surface(size).convert()
+        layer.fill(pg.Color("black"))
+        self.stars.draw_stars(layer)
+        self.hills_rect = self.hills.get_rect(bottomleft=layer.get_rect().bottomleft)
+        layer.blit(self.hills, self.hills_rect)
+        if dashboard:
+            if self.dashboard is None:
+                self.dashboard = prepare.GFX["dashboard"]
+            self.dash_rect = self.dashboard.get_rect(bottomleft=layer.get_rect().bottomleft)
+            layer.blit(self.dashboard, self.dash_rect)
+        self.layers[dashboard] = layer
+        return layer
+
+    def update(self, dt):
+        self.stars.update(dt)
+
+    def move(self, offset):
+        """Scroll the stars up by offset[1] pixels."""
+        self.stars.move(offset)
+        self.invalidate()
+
+    def draw(self, surface, dirty=None, dashboard=False):
+        """Draw the background, with the dashboard if dashboard is True. If
+        dirty (a tools.DirtyRects) is given only its previous areas are
+        restored unless it's full, and the areas of twinkling stars are
+        added to it."""
+        full = dirty is None or dirty.full
+        layer = self.layers.get(dashboard)
+        if layer is None or layer.get_size() != surface.get_size():
+            layer = self.make_layer(surface.get_size(), dashboard)
+        if layer is not self.layer:
+            self.layer = layer
+            full = True
+        if full:
+            surface.blit(self.layer, (0, 0))
+        else:
+            for rect in dirty.previous:
+                surface.blit(self.layer, rect, rect)
+        rects = self.stars.twinkle_rects()
+        if not rects:
+            return
+        self.stars.draw_twinkles(surface)
+        for rect in rects:
+            if rect.colliderect(self.hills_rect):
+                area = rect.move(-self.hills_rect.left, -self.hills_rect.top)
+                surface.blit(self.hills, rect, area)
+            if dirty is not None:
+                dirty.add(rect)
+        if dashboard:
+            self.draw_dashboard(surface, rects)
+
+    def draw_dashboard(self, surface, rects):
+        """Draw the parts of the dashboard inside rects again, over
+        anything drawn there that should be behind it."""
+        for rect in rects:
+            clipped = self.dash_rect.clip(rect)
+            if clipped:
+                area = clipped.move(-self.dash_rect.left, -self.dash_rect.top)
+                surface.blit(self.dashboard, clipped, area)
+
+
+def get_background(persist):
+    """Return the Background shared between states through persist,
+    making it if it doesn't exist yet."""
+    if "background" not in persist:
+        persist["background"] = Background(prepare.SCREEN_RECT)
+    return persist["background"]
+
+
+#Animation frames for each ship color, shared by every Word.
+SHIP_FRAMES = {}
+
+def get_ship_frames(index):
+    """Return the list of animation frames for ship number index,
+    stripping them from the sprite sheet the first time."""
+    if index not in SHIP_FRAMES:
+        sheet = prepare.GFX["ship{}".format(index)]
+        SHIP_FRAMES[index] = tools.strip_from_sheet(sheet, (0, 0), (184, 144), 8)
+    return SHIP_FRAMES[index]
+
+
+class RotationCache(object):
+    """
+    Rotated copies of an image. Angles are quantized to steps per full
+    turn and each step is rotated the first time it's needed, or all of
+    them up front if prebuild is True.
+    """
+    def __init__(self, image, steps=360, prebuild=False):
+        self.image = image
+        self.steps = steps
+        self.images = {}
+        if prebuild:
+            for step in range(steps):
+                self.get_step(step)
+
+    def quantize(self, angle):
+        """Return the step nearest to angle (in radians)."""
+        return int(round(angle * self.steps / (2 * pi))) % self.steps
+
+    def get_step(self, step):
+        if step not in self.images:
+            angle = step * 360. / self.steps
+            self.images[step] = pg.transform.rotate(self.image, angle)
+        return self.images[step]
+
+    def get(self, angle):
+        """Return the image rotated to angle (in radians)."""
+        return self.get_step(self.quantize(angle))
+
+
+#RotationCaches shared by every Turret and Lazer, keyed by (GFX name, steps)
+ROTATIONS = {}
+
+def get_rotations(name, steps=360):
+    """Return the shared RotationCache for prepare.GFX[name]."""
+    if (name, steps) not in ROTATIONS:
+        ROTATIONS[name, steps] = RotationCache(prepare.GFX[name], steps)
+    return ROTATIONS[name, steps]
 
 
 class Word(pg.sprite.Sprite):
@@ -48,37 +314,47 @@ class Word(pg.sprite.Sprite):
         self.speed = speed
         self.timer = 0
         self.ani_frequency = 120
-        x = randint(0, 6)
-        frames = tools.strip_from_sheet(prepare.GFX["ship{}".format(x)],
-                                                         (0, 0), (184, 144), 8)
-        self.frames = cycle(frames)
-        self.frame = next(self.frames)
+        self.frames = get_ship_frames(randint(0, 6))
+        self.frame_index = 0
+        self.frame = self.frames[self.frame_index]
         self.rect = self.frame.get_rect(center=self.pos)
+        self.previous_pos = self.pos
         
     def explode(self):
         self.kill()
         
     def update(self, dt):
+        self.previous_pos = self.pos
         self.timer += dt
         if self.timer >= self.ani_frequency:
             self.timer -= self.ani_frequency
-            self.frame = next(self.frames)
+            self.frame_index = (self.frame_index + 1) % len(self.frames)
+            self.frame = self.frames[self.frame_index]
         self.pos = self.pos[0] - (self.speed * dt), self.pos[1]
         self.rect.center = self.pos
         self.label.rect.center = (self.rect.left + self.center_offset[0],
                                            self.rect.top + self.center_offset[1])
         
-    def draw(self, surface):
-        surface.blit(self.frame, self.rect)
-        self.label.draw(surface)
+    def draw(self, surface, alpha=1.0):
+        """Draw the ship alpha of the way from its previous position to
+        its current one. Returns the area drawn to."""
+        offset = int(round((self.previous_pos[0] - self.pos[0]) * (1 - alpha)))
+        label_rect = self.label.rect
+        drawn = surface.blit(self.frame, (self.rect.x + offset, self.rect.y))
+        return drawn.union(surface.blit(self.label.image,
+                                        (label_rect.x + offset, label_rect.y)))
 
 
 class Turret(object):
     dish_offset = (31, 7)
+    rotation_steps = 360
     def __init__(self, midbottom):
         self.base = prepare.GFX["dish_base"]
         self.barrel = prepare.GFX["dish"]
+        self.rotations = get_rotations("dish", self.rotation_steps)
         self.angle = self.target_angle = 0
+        self.previous_angle = self.angle
+        self.step = None
         self.base_rect = self.base.get_rect(midbottom=midbottom)
         center = (self.base_rect.left + self.dish_offset[0],
                        self.base_rect.top + self.dish_offset[1])
@@ -92,7 +368,11 @@ class Turret(object):
         self.target_angle = target_angle
         
     def make_image(self):
-        self.image = pg.transform.rotate(self.barrel, degrees(self.angle))
+        step = self.rotations.quantize(self.angle)
+        if step == self.step:
+            return
+        self.step = step
+        self.image = self.rotations.get_step(step)
         center = (self.base_rect.left + self.dish_offset[0],
                       self.base_rect.top + self.dish_offset[1])
         self.rect = self.image.get_rect(center=center)
@@ -101,30 +381,65 @@ class Turret(object):
         self.shoot_sound.play()
         
     def update(self, dt):
+        self.previous_angle = self.angle
         if self.angle < self.target_angle:
             self.angle += min(self.rotation_speed * dt, self.target_angle - self.angle)
         elif self.angle > self.target_angle:
             self.angle -= min(self.rotation_speed * dt, self.angle - self.target_angle)
+        else:
+            return
         self.make_image()
             
-    def draw(self, surface):
-        surface.blit(self.base, self.base_rect)
-        surface.blit(self.image, self.rect)
+    def draw(self, surface, alpha=1.0):
+        """Draw the turret with the barrel alpha of the way from its
+        previous angle to its current one. Returns the area drawn to."""
+        image, rect = self.image, self.rect
+        if alpha < 1 and self.previous_angle != self.angle:
+            angle = self.previous_angle + (self.angle - self.previous_angle) * alpha
+            image = self.rotations.get(angle)
+            rect = image.get_rect(center=self.rect.center)
+        drawn = surface.blit(self.base, self.base_rect)
+        return drawn.union(surface.blit(image, rect))
 
         
 class Lazer(pg.sprite.Sprite):
     def __init__(self, origin, word, *groups):
         super(Lazer, self).__init__(*groups)
         self.word = word
-        angle = degrees(get_angle(origin, word.rect.center))
-        self.image = pg.transform.rotate(prepare.GFX["lazer"], angle)
+        angle = get_angle(origin, word.rect.center)
+        self.image = get_rotations("lazer").get(angle)
         self.rect = self.image.get_rect(center=origin)
+        self.previous_center = self.rect.center
+
+    def update(self, dt):
+        """Remember where the lazer was before its Animation moves it."""
+        self.previous_center = self.rect.center
+
+    def draw(self, surface, alpha=1.0):
+        """Draw the lazer alpha of the way from its previous position to
+        its current one. Returns the area drawn to."""
+        x0, y0 = self.previous_center
+        x1, y1 = self.rect.center
+        center = (int(round(x0 + (x1 - x0) * alpha)),
+                  int(round(y0 + (y1 - y0) * alpha)))
+        return surface.blit(self.image, self.image.get_rect(center=center))
         
     def die(self):
         self.word.kill()
         self.kill()
         
         
+def _scaled_nbytes(scaled):
+    width, height = scaled[0].get_size()
+    return width * height * 4 + width * height // 8
+
+
+#(image, mask) pairs for MaskedButton sizes, keyed by (image hash, size).
+#Buttons made from the same image share entries, and the entries outlive
+#the buttons so a rebuilt title screen doesn't have to scale them again.
+SCALED_BUTTONS = tools.LRUCache(1024, 32 * 1024 * 1024, _scaled_nbytes)
+
+
 class MaskedButton(pg.sprite.Sprite):
     inflate_time = 120
     deflate_time = 120
@@ -139,8 +454,9 @@ class MaskedButton(pg.sprite.Sprite):
         self.base_image.blit(image, img_rect)
         self.size = self.initial_size = size
         self.make_images()
+        self.set_size(size)
         self.hovered = False
-        self.animations = pg.sprite.Group()
+        self.animations = AnimationManager()
         self.held = False
         self.units_per_click = 1
         self.clicked = False
@@ -158,16 +474,36 @@ class MaskedButton(pg.sprite.Sprite):
             return False
 
     def make_images(self):
-        self.images, self.rects, self.masks = {}, {}, {}
+        """Work out the range of sizes the button can be drawn at. The
+        images and masks themselves are made by get_scaled when needed."""
         self.low = int(self.size * .95)
         self.high = int(self.size * 1.2)
-        for x in range(int(self.low * .4), int(self.high * 1.6)):
-            img = pg.transform.smoothscale(self.base_image, (x, x))
-            rect = img.get_rect(center=self.base_rect.center)
-            mask = pg.mask.from_surface(img, 0)
-            self.images[x] = img
-            self.rects[x] = rect
-            self.masks[x] = mask
+        self.min_size = int(self.low * .4)
+        self.max_size = int(self.high * 1.6) - 1
+        pixels = pg.image.tostring(self.base_image, "RGBA")
+        self.image_key = hashlib.md5(pixels).hexdigest()
+        self.current_size = None
+
+    def get_scaled(self, size):
+        """Return (image, mask) for the button scaled to size, scaling
+        and caching them in SCALED_BUTTONS on first use. The scaled image
+        is also kept in the SURFACE_CACHE, the mask is made from it."""
+        size = min(max(size, self.min_size), self.max_size)
+        key = (self.image_key, size)
+        scaled = SCALED_BUTTONS.get(key)
+        if scaled is None:
+            img = SURFACE_CACHE.get(("button",) + key, pg.transform.smoothscale,
+                                    self.base_image, (size, size))
+            scaled = img, pg.mask.from_surface(img, 0)
+            SCALED_BUTTONS[key] = scaled
+        return scaled
+
+    def set_size(self, size):
+        if size == self.current_size:
+            return
+        self.current_size = size
+        self.image, self.mask = self.get_scaled(size)
+        self.rect = self.image.get_rect(center=self.base_rect.center)
 
     def get_event(self, event):
         if not self.visible:
@@ -181,12 +517,9 @@ class MaskedButton(pg.sprite.Sprite):
     def update(self, dt, mouse_pos):
         self.animations.update(dt)
         hover = self.hovered
-        size = int(self.size)
-        self.image = self.images[size]
-        self.mask = self.masks[size]
-        self.rect = self.rects[size]
+        self.set_size(int(self.size))
         self.hovered = self.mask_point_collide(mouse_pos)
-        held = pg.mouse.get_pressed()[0]
+        held = replay.INPUT.mouse_pressed[0]
         if not held and self.held:
             self.held = False
             if self.hovered:
@@ -211,11 +544,8 @@ class MaskedButton(pg.sprite.Sprite):
         self.clicked = False
 
     def inflate(self, target):
-        self.animations.empty()
-        dur = self.inflate_time
-        ani = Animation(size=target, duration=dur, transition="out_elastic")
-        ani.start(self)
-        self.animations.add(ani)
+        self.animations.animate(self, size=target, duration=self.inflate_time,
+                                transition="out_elastic")
 
     def draw(self, surface):
         if self.visible:
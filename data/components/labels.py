@@ -12,6 +12,10 @@ from .. import prepare, tools
 #font already exists in LOADED_FONTS.
 LOADED_FONTS = {}
 
+#Rendered text surfaces are cached here so that setting a Label to text
+#it has shown before doesn't render it again. See render_text.
+RENDER_CACHE = tools.LRUCache(512)
+
 #Default values for Button objects - see Button class for specifics
 BUTTON_DEFAULTS = {
         "button_size": (128, 32),
@@ -137,6 +141,28 @@ def _parse_color(color):
     return color
 
 
+def render_text(font, text, text_color, fill_color=None, alpha=255):
+    """
+    Return a surface with text rendered in font. Surfaces are cached in
+    RENDER_CACHE keyed by all of the arguments, so the same text in the
+    same style is only rendered once while it stays in the cache. The
+    returned surface is shared and must not be drawn on.
+    """
+    key = (font, text, tuple(text_color),
+           fill_color and tuple(fill_color), alpha)
+    image = RENDER_CACHE.get(key)
+    if image is None:
+        if fill_color:
+            image = font.render(text, True, text_color, fill_color)
+        else:
+            image = font.render(text, True, text_color)
+        if alpha != 255:
+            image.set_colorkey(fill_color)
+            image.set_alpha(alpha)
+        RENDER_CACHE[key] = image
+    return image
+
+
 class Label(pg.sprite.Sprite, tools._KwargMixin):
     """
     Parent class all labels inherit from. Color arguments can use color names
@@ -182,6 +208,8 @@ class Label(pg.sprite.Sprite, tools._KwargMixin):
 
     def set_text(self, text):
         """Set the text to display."""
+        if text == getattr(self, "text", None):
+            return
         self.text = text
         self.update_text()
 
@@ -189,15 +217,8 @@ class Label(pg.sprite.Sprite, tools._KwargMixin):
         """Update the surface using the current properties and text."""
         if self.alpha != 255:
             self.fill_color = pg.Color(*[x + 1 if x < 255 else x - 1 for x in self.text_color[:3]])
-        if self.fill_color:
-            render_args = (self.text, True, self.text_color, self.fill_color)
-
-        else:
-            render_args = (self.text, True, self.text_color)
-        self.image = self.font.render(*render_args)
-        if self.alpha != 255:
-            self.image.set_colorkey(self.fill_color)
-            self.image.set_alpha(self.alpha)
+        self.image = render_text(self.font, self.text, self.text_color,
+                                 self.fill_color, self.alpha)
         self.rect = self.image.get_rect(**self.rect_attr)
 
     def draw(self, surface):
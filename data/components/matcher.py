@@ -0,0 +1,227 @@
+"""
+Keeps track of which on-screen Word the player's typing matches.
+
+A word's score is the number of positions where its characters equal
+the typed characters at the same index, e.g. "cart" scores 2 against
+"coat". The best target is the highest scoring word, with ties going to the word
+that was added first. Words with a score of 0 never match.
+
+WordMatcher is the default. ArrayMatcher gives the same results using
+NumPy, for waves with hundreds of words on screen. Use make_matcher to
+pick one.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def common_prefix_length(a, b):
+    """Return the number of leading characters a and b share."""
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class WordMatcher(object):
+    """
+    Incremental matcher. Words are indexed by (position, character) when
+    they're added, so a change to the typed text only touches the words
+    that share a character with the part of the buffer that changed.
+    Nothing is recomputed while the buffer stays the same, so the
+    per-frame cost doesn't depend on the number of words on screen.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.serial = 0
+        self.order = {}
+        self.scores = {}
+        self.by_score = {}
+        self.positions = {}
+        self.by_text = {}
+        self.best = None
+        self.stale = False
+
+    def __len__(self):
+        return len(self.order)
+
+    def add(self, word):
+        """Start tracking a Word sprite."""
+        self.serial += 1
+        self.order[word] = self.serial
+        for i, char in enumerate(word.word):
+            self.positions.setdefault((i, char), set()).add(word)
+        self.by_text.setdefault(word.word, []).append(word)
+        score = sum(1 for a, b in zip(word.word, self.buffer) if a == b)
+        self.scores[word] = score
+        self.by_score.setdefault(score, set()).add(word)
+        self.stale = True
+
+    def remove(self, word):
+        """Stop tracking a Word sprite. Removing a word twice is harmless."""
+        if word not in self.order:
+            return
+        del self.order[word]
+        for i, char in enumerate(word.word):
+            self.positions[i, char].discard(word)
+        self.by_text[word.word].remove(word)
+        if not self.by_text[word.word]:
+            del self.by_text[word.word]
+        self.by_score[self.scores.pop(word)].discard(word)
+        self.stale = True
+
+    def _rescore(self, word, change):
+        score = self.scores[word]
+        self.by_score[score].discard(word)
+        score += change
+        self.scores[word] = score
+        self.by_score.setdefault(score, set()).add(word)
+
+    def set_buffer(self, buffer):
+        """Update scores for the new typed text. Only the characters
+        after the part shared with the previous buffer are looked at."""
+        if buffer == self.buffer:
+            return
+        old = self.buffer
+        start = common_prefix_length(old, buffer)
+        for i in range(start, len(old)):
+            for word in self.positions.get((i, old[i]), ()):
+                self._rescore(word, -1)
+        for i in range(start, len(buffer)):
+            for word in self.positions.get((i, buffer[i]), ()):
+                self._rescore(word, 1)
+        self.buffer = buffer
+        self.stale = True
+
+    def closest(self):
+        """Return the best matching Word or None."""
+        if self.stale:
+            self.best = None
+            for score in range(len(self.buffer), 0, -1):
+                words = self.by_score.get(score)
+                if words:
+                    self.best = min(words, key=self.order.get)
+                    break
+            self.stale = False
+        return self.best
+
+    def exact_matches(self, text):
+        """Return every Word whose text is text, oldest first."""
+        return list(self.by_text.get(text, ()))
+
+
+class ArrayMatcher(object):
+    """
+    Vectorized matcher. Active words are stored as rows of a fixed-width
+    uint8 matrix (zero padded) so the scores of every word, or exact
+    matches against entered text, come out of a single NumPy pass.
+    Rows are reused as words come and go; the matrix doubles in height
+    or width when it runs out of room.
+    """
+    def __init__(self, capacity=64, width=32):
+        if np is None:
+            raise ImportError("ArrayMatcher requires numpy")
+        self.chars = np.zeros((capacity, width), dtype=np.uint8)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+        self.serials = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.words = [None] * capacity
+        self.rows = {}
+        self.free = list(range(capacity - 1, -1, -1))
+        self.serial = 0
+        self.buffer = ""
+        self.best = None
+        self.stale = False
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def encode(text):
+        return np.frombuffer(text.encode("ascii", "replace"), dtype=np.uint8)
+
+    def _grow(self):
+        capacity, width = self.chars.shape
+        self.chars = np.vstack((self.chars, np.zeros_like(self.chars)))
+        self.lengths = np.concatenate((self.lengths, np.zeros_like(self.lengths)))
+        self.serials = np.concatenate((self.serials, np.zeros_like(self.serials)))
+        self.alive = np.concatenate((self.alive, np.zeros_like(self.alive)))
+        self.words.extend([None] * capacity)
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def _widen(self, width):
+        extra = np.zeros((self.chars.shape[0], width - self.chars.shape[1]),
+                         dtype=np.uint8)
+        self.chars = np.hstack((self.chars, extra))
+
+    def add(self, word):
+        """Start tracking a Word sprite."""
+        encoded = self.encode(word.word)
+        if len(encoded) > self.chars.shape[1]:
+            self._widen(2 * len(encoded))
+        if not self.free:
+            self._grow()
+        row = self.free.pop()
+        self.serial += 1
+        self.chars[row] = 0
+        self.chars[row, :len(encoded)] = encoded
+        self.lengths[row] = len(encoded)
+        self.serials[row] = self.serial
+        self.alive[row] = True
+        self.words[row] = word
+        self.rows[word] = row
+        self.stale = True
+
+    def remove(self, word):
+        """Stop tracking a Word sprite. Removing a word twice is harmless."""
+        row = self.rows.pop(word, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.words[row] = None
+        self.free.append(row)
+        self.stale = True
+
+    def set_buffer(self, buffer):
+        if buffer != self.buffer:
+            self.buffer = buffer
+            self.stale = True
+
+    def closest(self):
+        """Return the best matching Word or None."""
+        if self.stale:
+            self.best = None
+            typed = self.encode(self.buffer)[:self.chars.shape[1]]
+            if len(typed) and self.rows:
+                scores = (self.chars[:, :len(typed)] == typed).sum(axis=1)
+                scores[~self.alive] = 0
+                top = scores.max()
+                if top > 0:
+                    rows = np.flatnonzero(scores == top)
+                    row = rows[np.argmin(self.serials[rows])]
+                    self.best = self.words[row]
+            self.stale = False
+        return self.best
+
+    def exact_matches(self, text):
+        """Return every Word whose text is text, oldest first."""
+        typed = self.encode(text)
+        if not len(typed) or len(typed) > self.chars.shape[1] or not self.rows:
+            return []
+        hits = self.alive & (self.lengths == len(typed))
+        hits &= (self.chars[:, :len(typed)] == typed).all(axis=1)
+        rows = np.flatnonzero(hits)
+        rows = rows[np.argsort(self.serials[rows])]
+        return [self.words[row] for row in rows]
+
+
+def make_matcher(vectorized=False):
+    """Return an ArrayMatcher if vectorized is True and NumPy is
+    available, otherwise a WordMatcher."""
+    if vectorized and np is not None:
+        return ArrayMatcher()
+    return WordMatcher()
@@ -0,0 +1,66 @@
+"""
+Runs slow loading jobs on a small thread pool so states can warm up
+data while the player is busy with something else.
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+
+class Preloader(object):
+    """
+    Jobs are submitted under a key. Submitting a key that was already
+    submitted does nothing, so it's safe to call submit every time a
+    state starts up. result(key, ...) waits for the job's return value,
+    or runs the job on the calling thread if it was never submitted.
+    """
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.pool = None
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, func, *args):
+        """Start func(*args) in the background unless key is already
+        loading or loaded."""
+        with self.lock:
+            if key in self.jobs:
+                return
+            if self.pool is None:
+                self.pool = ThreadPool(self.workers)
+            self.jobs[key] = self.pool.apply_async(func, args)
+
+    def ready(self, key):
+        """Whether the job for key has finished."""
+        with self.lock:
+            job = self.jobs.get(key)
+        return job is not None and job.ready()
+
+    def result(self, key, func, *args):
+        """Return the result of the job for key, waiting for it if it's
+        still running. If key was never submitted, or its job failed,
+        func(*args) is called directly."""
+        with self.lock:
+            job = self.jobs.get(key)
+        if job is not None:
+            try:
+                return job.get()
+            except Exception:
+                with self.lock:
+                    self.jobs.pop(key, None)
+        return func(*args)
+
+
+def read_file(path):
+    """Read a whole file so later loads hit the OS cache. Returns the
+    number of bytes read."""
+    total = 0
+    with open(path, "rb") as f:
+        chunk = f.read(65536)
+        while chunk:
+            total += len(chunk)
+            chunk = f.read(65536)
+    return total
+
+
+PRELOADER = Preloader()
@@ -0,0 +1,165 @@
+"""
+An on-disk cache for Surfaces derived from the game's resources, like
+the smoothscaled MaskedButton images, so they're made once rather than on
+every run. Only use it for Surfaces that are slower to make than to read
+back; a plain rotate, for instance, isn't.
+
+Each Surface is stored in its own file as a small header followed by its
+RGBA pixels. Files are memory-mapped when they're loaded and, on Python
+3, converted straight from the map without copying. Entries live in a
+directory named for VERSION and a fingerprint of the resources folder, so
+changing a resource (or the format) starts a fresh cache and the old
+directory is removed.
+"""
+
+import os
+import mmap
+import struct
+import shutil
+import hashlib
+
+import pygame as pg
+
+
+VERSION = 1
+CACHE_DIR = os.path.join("cache", "surfaces")
+RESOURCES_DIR = "resources"
+
+#Files under RESOURCES_DIR that are built from other resources and
+#shouldn't change the fingerprint.
+GENERATED = ("lexicon.idx", "assets.bundle")
+
+#magic, version, reserved, width, height
+HEADER = struct.Struct("<4sHHII")
+MAGIC = b"WBSF"
+
+
+#Fingerprints already computed by this process, keyed by directory.
+_FINGERPRINTS = {}
+
+def fingerprint(directory=RESOURCES_DIR):
+    """Hash of the names, sizes and modification times of every file
+    under directory. The files are only walked the first time a directory
+    is fingerprinted, later calls return the same hash."""
+    if directory not in _FINGERPRINTS:
+        _FINGERPRINTS[directory] = _fingerprint(directory)
+    return _FINGERPRINTS[directory]
+
+
+def _fingerprint(directory):
+    md5 = hashlib.md5()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name in GENERATED:
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            entry = "{}|{}|{}\n".format(os.path.relpath(path, directory),
+                                        stat.st_size, int(stat.st_mtime))
+            md5.update(entry.encode("utf-8"))
+    return md5.hexdigest()
+
+
+class SurfaceCache(object):
+    """
+    Loads and saves Surfaces by key. A key can be anything with a stable
+    repr, usually a tuple of the source's name or hash and the parameters
+    used to make the Surface from it. If the cache directory can't be
+    written to, get still works, it just doesn't save anything.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, resources_dir=RESOURCES_DIR):
+        self.cache_dir = cache_dir
+        self.resources_dir = resources_dir
+        self.enabled = True
+        self._directory = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def directory(self):
+        """The directory for the current VERSION and resources, created
+        (and older ones removed) the first time it's needed."""
+        if self._directory is None:
+            name = "v{}-{}".format(VERSION, fingerprint(self.resources_dir)[:16])
+            directory = os.path.join(self.cache_dir, name)
+            try:
+                if os.path.isdir(self.cache_dir):
+                    for old in os.listdir(self.cache_dir):
+                        if old != name:
+                            shutil.rmtree(os.path.join(self.cache_dir, old), True)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+            except OSError:
+                self.enabled = False
+            self._directory = directory
+        return self._directory
+
+    def path(self, key):
+        name = hashlib.md5(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + ".surf")
+
+    def load(self, key):
+        """Return the Surface saved under key or None."""
+        if not self.enabled:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            if len(mapped) < HEADER.size:
+                return None
+            magic, version, _, width, height = HEADER.unpack_from(mapped)
+            if (magic != MAGIC or version != VERSION or
+                    len(mapped) != HEADER.size + width * height * 4):
+                return None
+            try:
+                pixels = memoryview(mapped)[HEADER.size:]
+            except TypeError:
+                #Python 2's mmap has no new-style buffer, copy the pixels.
+                pixels = mapped[HEADER.size:]
+                return pg.image.frombuffer(pixels, (width, height),
+                                           "RGBA").convert_alpha()
+            #frombuffer reads the pixels straight from the map, so the view
+            #(and the Surface using it) has to go before the map is closed.
+            try:
+                return pg.image.frombuffer(pixels, (width, height),
+                                           "RGBA").convert_alpha()
+            finally:
+                pixels.release()
+        finally:
+            mapped.close()
+
+    def save(self, key, surface):
+        """Write surface to the cache under key."""
+        width, height = surface.get_size()
+        if not self.enabled or not width or not height:
+            return
+        path = self.path(key)
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(temp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, width, height))
+                f.write(pg.image.tostring(surface, "RGBA"))
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(temp, path)
+        except (IOError, OSError):
+            pass
+
+    def get(self, key, make, *args):
+        """Return the Surface saved under key, or make(*args) after saving
+        it if there isn't one."""
+        surface = self.load(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = make(*args)
+        self.save(key, surface)
+        return surface
+
+
+SURFACE_CACHE = SurfaceCache()
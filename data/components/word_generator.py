@@ -1,16 +1,462 @@
+"""
+Word list loading.
+
+The playable words are read from a compiled, memory-mapped index.
+
+build_index compiles resources/2of12inf.txt (plus definitions from
+resources/dictionary.json when that file exists) into a single binary
+index file. Words are bucketed by length and each bucket is stored as
+one contiguous run of fixed-width, sorted records, so selecting every
+word shorter than some length is a matter of picking buckets rather than
+parsing and filtering the whole list.
+
+INDEX LAYOUT (all integers little-endian)
+
+header:  magic "WBLX", version (H), bucket count (H), blob offset (I)
+table:   per bucket - word length (H), word count (I),
+         words offset (I), definition offsets offset (I)
+buckets: word count * word length bytes of sorted lowercase ascii
+offsets: per bucket, word count + 1 uint32 offsets into the blob
+blob:    utf-8 encoded definitions
+"""
+
 import os
+import io
 import json
+import mmap
+import struct
+import sys
+import random
+import threading
+from bisect import bisect_right
+
+from .. import tools
 
 
 letters = "abcdefghijklmnopqrstuvwxyz"
 
+WORDS_PATH = os.path.join("resources", "2of12inf.txt")
+DEFINITIONS_PATH = os.path.join("resources", "dictionary.json")
+INDEX_PATH = os.path.join("resources", "lexicon.idx")
+
+MAGIC = b"WBLX"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+BUCKET = struct.Struct("<HIII")
+OFFSET = struct.Struct("<I")
+
+#2of12inf marks some entries with these characters, they aren't
+#part of the word itself.
+MARKERS = "%!"
+
+
+def read_word_list(path):
+    """Return the set of playable words listed one per line in path."""
+    words = set()
+    with io.open(path, "r", encoding="ascii", errors="ignore") as f:
+        for line in f:
+            word = line.strip().rstrip(MARKERS).lower()
+            if len(word) > 2 and all((x in letters for x in word)):
+                words.add(word)
+    return words
+
+
+def read_definitions(path):
+    """Return a dict of lowercase word: definition from a json file,
+    or an empty dict if the file doesn't exist."""
+    if not os.path.exists(path):
+        return {}
+    with io.open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return {k.lower(): v for k, v in raw.items() if v}
+
+
+def build_index(words_path=WORDS_PATH, definitions_path=DEFINITIONS_PATH,
+                index_path=INDEX_PATH):
+    """Compile the word list and definitions into a binary index file."""
+    definitions = read_definitions(definitions_path)
+    words = read_word_list(words_path)
+    words.update(w for w in definitions
+                 if len(w) > 2 and all((x in letters for x in w)))
+    buckets = {}
+    for word in words:
+        buckets.setdefault(len(word), []).append(word)
+    lengths = sorted(buckets)
+
+    table = []
+    word_data = []
+    offset_data = []
+    blob = []
+    blob_size = 0
+    position = HEADER.size + BUCKET.size * len(lengths)
+    words_size = sum(len(buckets[n]) * n for n in lengths)
+    offsets_position = position + words_size
+    for length in lengths:
+        bucket = sorted(buckets[length])
+        table.append(BUCKET.pack(length, len(bucket), position,
+                                 offsets_position))
+        word_data.append("".join(bucket).encode("ascii"))
+        position += len(bucket) * length
+        for word in bucket:
+            offset_data.append(OFFSET.pack(blob_size))
+            text = u"{}".format(definitions.get(word, u"")).encode("utf-8")
+            blob.append(text)
+            blob_size += len(text)
+        offset_data.append(OFFSET.pack(blob_size))
+        offsets_position += (len(bucket) + 1) * OFFSET.size
+    header = HEADER.pack(MAGIC, VERSION, len(lengths), offsets_position)
+
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(b"".join(table))
+        f.write(b"".join(word_data))
+        f.write(b"".join(offset_data))
+        f.write(b"".join(blob))
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    os.rename(temp_path, index_path)
+
+
+def index_is_stale(index_path=INDEX_PATH, sources=(WORDS_PATH, DEFINITIONS_PATH)):
+    """Whether the index is missing or older than any of its sources."""
+    if not os.path.exists(index_path):
+        return True
+    built = os.path.getmtime(index_path)
+    return any(os.path.getmtime(p) > built for p in sources if os.path.exists(p))
+
+
+class Bucket(object):
+    """A read-only sequence of all the words of a single length."""
+    def __init__(self, data, length, count, words_offset, offsets_offset,
+                 blob_offset):
+        self.data = data
+        self.length = length
+        self.count = count
+        self.words_offset = words_offset
+        self.offsets_offset = offsets_offset
+        self.blob_offset = blob_offset
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("bucket index out of range")
+        start = self.words_offset + index * self.length
+        return self.data[start:start + self.length].decode("ascii")
+
+    def index(self, word):
+        """Return the position of word in the bucket or -1."""
+        if len(word) != self.length:
+            return -1
+        target = word.encode("ascii")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.words_offset + mid * self.length
+            if self.data[start:start + self.length] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = self.words_offset + lo * self.length
+        if lo < self.count and self.data[start:start + self.length] == target:
+            return lo
+        return -1
+
+    def definition(self, index):
+        """Read the definition of the word at index from the index file."""
+        start = self.offsets_offset + index * OFFSET.size
+        begin, end = struct.unpack_from("<II", self.data, start)
+        begin += self.blob_offset
+        end += self.blob_offset
+        return self.data[begin:end].decode("utf-8")
+
+
+class Lexicon(object):
+    """Memory-mapped view of a compiled index file."""
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_buckets, blob_offset = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} lexicon index".format(
+                             path, VERSION))
+        self.buckets = {}
+        for i in range(num_buckets):
+            fields = BUCKET.unpack_from(self.data, HEADER.size + i * BUCKET.size)
+            length, count, words_offset, offsets_offset = fields
+            self.buckets[length] = Bucket(self.data, length, count,
+                                          words_offset, offsets_offset,
+                                          blob_offset)
+
+    def locate(self, word):
+        """Return the (bucket, index) pair holding word or None."""
+        bucket = self.buckets.get(len(word))
+        if bucket is None:
+            return None
+        index = bucket.index(word)
+        if index == -1:
+            return None
+        return bucket, index
+
+    def words(self, max_length):
+        """Return a WordView of every word shorter than max_length."""
+        buckets = [self.buckets[n] for n in sorted(self.buckets) if n < max_length]
+        return WordView(buckets)
+
+    def close(self):
+        self.data.close()
+
+
+class WordView(object):
+    """
+    A read-only sequence spanning several buckets. Creating a view
+    doesn't touch any of the words it contains.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.buckets_by_length = {b.length: b for b in buckets}
+        self.starts = []
+        total = 0
+        for bucket in buckets:
+            self.starts.append(total)
+            total += len(bucket)
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def nbytes(self):
+        """Approximate memory used by the view itself. The words stay in
+        the mapped index and aren't counted."""
+        return (sys.getsizeof(self.buckets) + sys.getsizeof(self.starts) +
+                sys.getsizeof(self.buckets_by_length))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.total
+        if not 0 <= index < self.total:
+            raise IndexError("word index out of range")
+        b = bisect_right(self.starts, index) - 1
+        return self.buckets[b][index - self.starts[b]]
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            for i in range(len(bucket)):
+                yield bucket[i]
+
+    def __contains__(self, word):
+        bucket = self.buckets_by_length.get(len(word))
+        return bucket is not None and bucket.index(word) != -1
+
+
+class DefinitionStore(object):
+    """
+    Looks up definitions on demand. Only the index's word buckets and
+    offset tables are mapped, the text of a definition is read from the
+    index when it's asked for. The most recent lookups are kept in a
+    small LRU cache.
+    """
+    def __init__(self, lexicon, cache_size=32):
+        self.lexicon = lexicon
+        self.cache = tools.LRUCache(cache_size)
+
+    def __getitem__(self, word):
+        defined = self.cache.get(word)
+        if defined is None:
+            found = self.lexicon.locate(word)
+            if found is None:
+                raise KeyError(word)
+            bucket, index = found
+            defined = bucket.definition(index)
+            self.cache[word] = defined
+        return defined
+
+    def get(self, word, default=""):
+        """Return the definition of word or default if it isn't in
+        the lexicon."""
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+
+class AliasTable(object):
+    """
+    Walker's alias method. After an O(n) setup, sample returns
+    index i with probability weights[i] / sum(weights) in constant time.
+    """
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        if not n or total <= 0:
+            raise ValueError("AliasTable needs at least one positive weight")
+        scaled = [w * n / total for w in weights]
+        self.size = n
+        self.prob = [1.] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = (scaled[more] + scaled[less]) - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+    def nbytes(self):
+        """Approximate memory used by the table."""
+        return (sys.getsizeof(self.prob) + sys.getsizeof(self.alias) +
+                sys.getsizeof(1.) * self.size)
+
+    def sample(self):
+        i = int(random.random() * self.size)
+        if random.random() < self.prob[i]:
+            return i
+        return self.alias[i]
+
+
+class WordSampler(object):
+    """
+    Picks random words from a WordView in constant time.
+
+    By default every word is equally likely: a bucket is chosen with
+    probability proportional to its size, then a word is chosen
+    uniformly from that bucket. length_bias skews the choice toward
+    longer (positive) or shorter (negative) words by weighting each word
+    by length ** length_bias. Alternatively, weights can be a sequence of
+    per-word weights (word frequency, difficulty, etc.) aligned with the
+    view, which builds an alias table over every word instead.
+    """
+    def __init__(self, view, length_bias=0, weights=None):
+        self.view = view
+        self.buckets = [b for b in view.buckets if len(b)]
+        if weights is not None:
+            if len(weights) != len(view):
+                raise ValueError("weights must have one entry per word")
+            self.word_table = AliasTable(weights)
+            self.bucket_table = None
+        else:
+            self.word_table = None
+            self.bucket_table = AliasTable([len(b) * (b.length ** length_bias)
+                                            for b in self.buckets])
+
+    def __len__(self):
+        return len(self.view)
+
+    def nbytes(self):
+        """Approximate memory used by the sampler's tables."""
+        table = self.word_table or self.bucket_table
+        return table.nbytes() + sys.getsizeof(self.buckets)
+
+    def sample(self):
+        """Return a random word."""
+        if self.word_table is not None:
+            return self.view[self.word_table.sample()]
+        bucket = self.buckets[self.bucket_table.sample()]
+        return bucket[int(random.random() * len(bucket))]
+
+
+class LexiconCache(object):
+    """
+    Process-wide cache of the lexicon. The index is opened once and
+    shared; WordViews and WordSamplers for each max_length are built on
+    first request and reused, so replaying a difficulty or switching
+    between difficulties with overlapping word lengths costs nothing.
+
+    Views and samplers only reference the mapped buckets, they never copy
+    words. Their own (small) memory is tracked and the least recently
+    used ones are evicted once max_bytes is exceeded. memory_usage
+    reports the mapped index size and the derived data separately.
+
+    The cache is safe to use from background loading threads.
+    """
+    def __init__(self, index_path=INDEX_PATH, max_bytes=4 * 1024 * 1024):
+        self.lock = threading.RLock()
+        self.index_path = index_path
+        self.lexicon = None
+        self.definitions = None
+        self.entries = tools.LRUCache(64, max_bytes, lambda x: x.nbytes())
+
+    def get_lexicon(self):
+        """Return the Lexicon, compiling and mapping the index if needed."""
+        with self.lock:
+            if self.lexicon is None:
+                if index_is_stale(self.index_path):
+                    build_index(index_path=self.index_path)
+                self.lexicon = Lexicon(self.index_path)
+            return self.lexicon
+
+    def get_definitions(self):
+        """Return the DefinitionStore for the lexicon."""
+        with self.lock:
+            if self.definitions is None:
+                self.definitions = DefinitionStore(self.get_lexicon())
+            return self.definitions
+
+    def words(self, max_length):
+        """Return the WordView of words shorter than max_length."""
+        with self.lock:
+            key = ("words", max_length)
+            view = self.entries.get(key)
+            if view is None:
+                view = self.get_lexicon().words(max_length)
+                self.entries[key] = view
+            return view
+
+    def sampler(self, max_length, length_bias=0):
+        """Return a WordSampler over words shorter than max_length."""
+        with self.lock:
+            key = ("sampler", max_length, length_bias)
+            sampler = self.entries.get(key)
+            if sampler is None:
+                sampler = WordSampler(self.words(max_length), length_bias)
+                self.entries[key] = sampler
+            return sampler
+
+    def memory_usage(self):
+        """Return a dict of approximate memory use in bytes."""
+        mapped = len(self.lexicon.data) if self.lexicon is not None else 0
+        return {"mapped": mapped,
+                "derived": self.entries.nbytes,
+                "entries": len(self.entries),
+                "evictions": self.entries.evictions}
+
+    def clear(self):
+        """Drop everything, unmapping the index."""
+        with self.lock:
+            self.entries.clear()
+            self.definitions = None
+            if self.lexicon is not None:
+                self.lexicon.close()
+                self.lexicon = None
+
+
+LEXICON_CACHE = LexiconCache()
+
+
+def get_lexicon():
+    """Return the shared Lexicon."""
+    return LEXICON_CACHE.get_lexicon()
+
+
+def get_definitions():
+    """Return the shared DefinitionStore."""
+    return LEXICON_CACHE.get_definitions()
+
+
 def load_words(max_length):
-    p = os.path.join("resources", "dictionary.json")
-    raw_words = {}
-    with open(p, "r") as f:
-        words = json.load(f)
-        raw_words = {k.lower(): v for k, v in words.items() 
-                              if max_length > len(k) > 2 
-                              and all((x in letters for x in k.lower()))}
-    return raw_words
-    
\ No newline at end of file
+    """Return a WordView of playable words shorter than max_length."""
+    return LEXICON_CACHE.words(max_length)
+
+
+def get_sampler(max_length, length_bias=0):
+    """Return a shared WordSampler of words shorter than max_length."""
+    return LEXICON_CACHE.sampler(max_length, length_bias)
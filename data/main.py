@@ -1,10 +1,29 @@
-from . import prepare,tools
+import os
+
+from . import prepare, tools, profiling, replay
 from .states import title_screen, gameplay, gameover
 
-def main():
+def make_states():
+    """States are made when Control first needs them."""
+    return {"TITLE": title_screen.TitleScreen,
+               "GAMEPLAY": gameplay.Gameplay,
+               "GAMEOVER": gameover.GameOverScreen}
+
+def main(record_path=None, replay_path=None, count_allocations=False):
+    """Run the game. If record_path is given the session is saved there
+    when the game ends, if replay_path is given the session recorded there
+    is played back instead of reading the player's input. count_allocations
+    turns on profiling's Surface counters."""
+    if count_allocations or os.environ.get("WORDBLASTER_COUNT_ALLOCATIONS"):
+        profiling.install_counters()
+    if replay_path:
+        replay.INPUT.play(replay.Recording.load(replay_path))
+    elif record_path:
+        replay.INPUT.record()
     controller = tools.Control(prepare.ORIGINAL_CAPTION)
-    states = {"TITLE": title_screen.TitleScreen(),
-                   "GAMEPLAY": gameplay.Gameplay(),
-                   "GAMEOVER": gameover.GameOverScreen()}
-    controller.setup_states(states, "TITLE")
+    controller.setup_states(make_states(), "TITLE")
     controller.main()
+    recording = replay.INPUT.stop()
+    if record_path and recording is not None:
+        recording.checksum = replay.screen_checksum(controller.screen)
+        recording.save(record_path)
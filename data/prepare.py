@@ -1,6 +1,7 @@
 import os
 import pygame as pg
 from . import tools
+from .components.bundle import open_bundle
 
 
 SCREEN_SIZE = (1280, 720)
@@ -17,5 +18,12 @@ SCREEN_RECT = SCREEN.get_rect()
 
 FONTS = tools.load_all_fonts(os.path.join("resources", "fonts"))
 MUSIC = tools.load_all_music(os.path.join("resources", "music"))
-SFX   = tools.load_all_sfx(os.path.join("resources", "sound"))
-GFX   = tools.load_all_gfx(os.path.join("resources", "graphics"))
\ No newline at end of file
+#Decoded graphics and sounds packed by build_bundle.py, if it's been run
+BUNDLE = open_bundle()
+SFX   = tools.lazy_sfx(os.path.join("resources", "sound"), bundle=BUNDLE)
+GFX   = tools.lazy_gfx(os.path.join("resources", "graphics"), bundle=BUNDLE)
+
+
+def asset_report():
+    """Which graphics and sounds have been used so far."""
+    return {"GFX": GFX.report(), "SFX": SFX.report()}
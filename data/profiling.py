@@ -0,0 +1,155 @@
+"""
+Frame instrumentation used by Control.
+
+FrameRecorder keeps per-frame phase timings and allocation counts in a
+fixed-size ring buffer. FrameOverlay draws the recorded frames as a bar
+graph on top of the game. install_counters wraps the pygame functions
+that create Surfaces so the recorder can report how many were made each
+frame. That replaces pygame classes with subclasses and slows down every
+call it wraps, so it's only done when asked for with --count-allocations
+or the WORDBLASTER_COUNT_ALLOCATIONS environment variable; otherwise the
+counts stay at zero.
+"""
+
+import json
+from array import array
+from timeit import default_timer
+
+import pygame as pg
+
+
+#Running totals incremented by the wrappers installed by install_counters.
+COUNTS = {"surfaces": 0, "renders": 0}
+
+_installed = False
+
+def install_counters():
+    """
+    Count Surface creation and font rendering from now on. pygame.Surface
+    and pygame.font.Font are replaced with subclasses that count, and the
+    pygame.transform functions that return new Surfaces are wrapped.
+    Surfaces made by C code other than those (image.load, copy, convert,
+    subsurface) and fonts created before this is called aren't counted.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    class CountingSurface(pg.Surface):
+        def __init__(self, *args, **kwargs):
+            COUNTS["surfaces"] += 1
+            super(CountingSurface, self).__init__(*args, **kwargs)
+
+    class CountingFont(pg.font.Font):
+        def render(self, *args, **kwargs):
+            COUNTS["renders"] += 1
+            COUNTS["surfaces"] += 1
+            return super(CountingFont, self).render(*args, **kwargs)
+
+    def counted(func):
+        def wrapper(*args, **kwargs):
+            COUNTS["surfaces"] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    pg.Surface = CountingSurface
+    pg.font.Font = CountingFont
+    for name in ("rotate", "rotozoom", "scale", "smoothscale", "flip"):
+        setattr(pg.transform, name, counted(getattr(pg.transform, name)))
+
+
+class FrameRecorder(object):
+    """
+    Records how long each phase of a frame took, plus how many Surfaces
+    were created and fonts rendered during it, for the last size frames.
+    """
+    phases = ("event_loop", "update", "draw", "present")
+    counters = ("surfaces", "renders")
+
+    def __init__(self, size=300):
+        self.size = size
+        self.columns = {}
+        for name in self.phases:
+            self.columns[name] = array("d", [0.] * size)
+        for name in self.counters:
+            self.columns[name] = array("l", [0] * size)
+        self.index = 0
+        self.count = 0
+        self.current = {}
+        self.start_counts = {}
+
+    def __len__(self):
+        return self.count
+
+    def begin_frame(self):
+        self.current = dict((name, 0.) for name in self.phases)
+        self.start_counts = dict(COUNTS)
+
+    def time(self, phase, func, *args):
+        """Call func(*args), adding the time it took to phase."""
+        start = default_timer()
+        result = func(*args)
+        self.current[phase] += default_timer() - start
+        return result
+
+    def end_frame(self):
+        for name in self.phases:
+            self.columns[name][self.index] = self.current[name]
+        for name in self.counters:
+            self.columns[name][self.index] = COUNTS[name] - self.start_counts[name]
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def frames(self):
+        """Return the recorded frames, oldest first, as a list of dicts.
+        Times are in milliseconds."""
+        first = (self.index - self.count) % self.size
+        frames = []
+        for i in range(self.count):
+            j = (first + i) % self.size
+            frame = dict((name, self.columns[name][j] * 1000) for name in self.phases)
+            for name in self.counters:
+                frame[name] = self.columns[name][j]
+            frames.append(frame)
+        return frames
+
+    def dump(self, path):
+        """Write the recorded frames to path as JSON."""
+        with open(path, "w") as f:
+            json.dump({"frames": self.frames()}, f, indent=1)
+
+
+class FrameOverlay(object):
+    """
+    Bar graph of the recorded frames, newest on the right. Each bar stacks
+    the phases of one frame; the line marks the 60 FPS frame budget.
+    """
+    colors = {"event_loop": (80, 160, 255),
+              "update": (80, 220, 120),
+              "draw": (255, 190, 60),
+              "present": (230, 80, 80)}
+    budget = 1000 / 60.
+
+    def __init__(self, recorder, topleft=(8, 8), height=120, ms_per_pixel=.25):
+        self.recorder = recorder
+        self.rect = pg.Rect(topleft, (recorder.size, height))
+        self.ms_per_pixel = ms_per_pixel
+        self.image = pg.Surface(self.rect.size)
+        self.image.set_alpha(200)
+
+    def draw(self, surface):
+        self.image.fill((20, 20, 30))
+        bottom = self.rect.height
+        x = self.rect.width - len(self.recorder)
+        for frame in self.recorder.frames():
+            y = bottom
+            for phase in self.recorder.phases:
+                h = int(frame[phase] / self.ms_per_pixel)
+                if h:
+                    self.image.fill(self.colors[phase], (x, y - h, 1, h))
+                    y -= h
+            x += 1
+        budget_y = bottom - int(self.budget / self.ms_per_pixel)
+        self.image.fill((255, 255, 255), (0, budget_y, self.rect.width, 1))
+        surface.blit(self.image, self.rect)
@@ -0,0 +1,185 @@
+"""
+Recording and replaying play sessions.
+
+Everything the game reads from the outside world goes through INPUT: the
+frame time from the clock, the event queue and the mouse. Normally INPUT
+just passes those through. When recording it also writes them down, frame
+by frame, along with the seed the random module was started with. When
+playing back it hands out the recorded values instead, so with the same
+seed and the same build a session plays out exactly as it was recorded.
+
+Recordings are saved as JSON:
+
+    {"version": 1, "seed": 1234, "checksum": 987654321,
+     "frames": [{"frame": 0, "time": 16, "dt": 16,
+                 "mouse": [[x, y], [0, 0, 0]],
+                 "events": [[type, {attribute: value, ...}], ...]}, ...]}
+
+checksum is a CRC of the screen after the last frame, so a replay can
+check that it ended up drawing the same picture.
+"""
+
+import json
+import random
+import zlib
+
+import pygame as pg
+
+
+VERSION = 1
+
+
+def _plain(value):
+    """Return value as something JSON can store or None if it can't be."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    try:
+        if isinstance(value, basestring):
+            return value
+    except NameError:
+        if isinstance(value, str):
+            return value
+    if isinstance(value, (tuple, list)):
+        items = [_plain(v) for v in value]
+        if all(item is not None for item in items):
+            return items
+    return None
+
+
+def serialize_event(event):
+    """Return event as [type, attributes]. Attributes that can't be stored
+    (like pygame 2's window object) are left out."""
+    attributes = {}
+    for name, value in event.dict.items():
+        value = _plain(value)
+        if value is not None:
+            attributes[name] = value
+    return [event.type, attributes]
+
+
+def deserialize_event(data):
+    """Rebuild an Event from the output of serialize_event."""
+    event_type, attributes = data
+    kwargs = {}
+    for name, value in attributes.items():
+        if isinstance(value, list):
+            value = tuple(value)
+        kwargs[str(name)] = value
+    return pg.event.Event(event_type, **kwargs)
+
+
+def screen_checksum(surface):
+    """CRC of surface's pixels."""
+    return zlib.crc32(pg.image.tostring(surface, "RGB")) & 0xffffffff
+
+
+class Recording(object):
+    """A recorded session: the random seed and the input of every frame."""
+    def __init__(self, seed=None, frames=None, checksum=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.frames = frames if frames is not None else []
+        self.checksum = checksum
+
+    def __len__(self):
+        return len(self.frames)
+
+    def save(self, path):
+        data = {"version": VERSION, "seed": self.seed,
+                "checksum": self.checksum, "frames": self.frames}
+        with open(path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != VERSION:
+            raise ValueError("{} is not a version {} recording".format(path, VERSION))
+        return cls(data["seed"], data["frames"], data.get("checksum"))
+
+
+class InputSource(object):
+    """
+    Supplies frame times, events and the mouse state to the game, live,
+    while recording or from a recording. Control calls frame_time and then
+    get_events once per frame; everything else reads mouse_pos and
+    mouse_pressed, which hold the state for the current frame.
+    """
+    def __init__(self):
+        self.recording = None
+        self.playing = False
+        self.index = -1
+        self.time = 0
+        self.mouse_pos = (0, 0)
+        self.mouse_pressed = (0, 0, 0)
+
+    def record(self, recording=None):
+        """Start recording into recording (a new one by default) and seed
+        the random module with its seed. Call this before the states are
+        made, they use random as they're set up."""
+        self.recording = recording if recording is not None else Recording()
+        self.playing = False
+        self.index = -1
+        self.time = 0
+        random.seed(self.recording.seed)
+        return self.recording
+
+    def play(self, recording):
+        """Start playing back recording. Like record, this seeds the random
+        module and should be called before the states are made."""
+        self.recording = recording
+        self.playing = True
+        self.index = -1
+        self.time = 0
+        random.seed(recording.seed)
+
+    def stop(self):
+        """Go back to live input. Returns the recording, if any."""
+        recording = self.recording
+        self.recording = None
+        self.playing = False
+        return recording
+
+    @property
+    def finished(self):
+        """True once every frame of the recording being played is used."""
+        return self.playing and self.index >= len(self.recording) - 1
+
+    def frame_time(self, dt):
+        """Start a new frame that took dt milliseconds. Returns the frame
+        time the game should use, which is the recorded one on playback."""
+        self.index += 1
+        if self.playing:
+            frame = self.recording.frames[self.index]
+            dt = frame["dt"]
+        elif self.recording is not None:
+            frame = {"frame": self.index, "time": self.time + dt, "dt": dt,
+                     "mouse": None, "events": []}
+            self.recording.frames.append(frame)
+        self.time += dt
+        return dt
+
+    def get_events(self):
+        """Return this frame's events and update the mouse state."""
+        if self.playing:
+            # Events posted by the game itself were recorded with the
+            # rest, so the real queue is emptied and ignored.
+            pg.event.get()
+            frame = self.recording.frames[self.index]
+            pos, pressed = frame["mouse"]
+            self.mouse_pos = tuple(pos)
+            self.mouse_pressed = tuple(pressed)
+            return [deserialize_event(e) for e in frame["events"]]
+        events = pg.event.get()
+        self.mouse_pos = pg.mouse.get_pos()
+        self.mouse_pressed = pg.mouse.get_pressed()
+        if self.recording is not None:
+            frame = self.recording.frames[self.index]
+            frame["mouse"] = [list(self.mouse_pos), list(self.mouse_pressed)]
+            frame["events"] = [serialize_event(e) for e in events]
+        return events
+
+
+INPUT = InputSource()
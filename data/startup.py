@@ -0,0 +1,101 @@
+"""
+Startup tracing. When enabled, TRACER records the wall time of each
+import, each asset load and each state constructor, and the time from
+this module being imported to the first frame being shown, then prints
+them to stderr. It's off unless enable is called or the
+WORDBLASTER_TRACE_STARTUP environment variable is set, and when off it
+costs one attribute check per traced call.
+
+This module doesn't import pygame so it can be imported first and time
+everything else, pygame included.
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+from timeit import default_timer
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+
+class StartupTracer(object):
+    def __init__(self):
+        self.start = default_timer()
+        self.enabled = False
+        self.events = []
+        self.depth = 0
+        self.first_frame_time = None
+        self._import = None
+
+    def enable(self):
+        """Start tracing, including imports from now on."""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._import = builtins.__import__
+        builtins.__import__ = self._traced_import
+
+    def disable(self):
+        """Stop tracing and put the import function back."""
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+        self.enabled = False
+
+    def _traced_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        loaded = len(sys.modules)
+        with self.span("import", "." * level + (name or ",".join(fromlist or ()))) as event:
+            module = self._import(name, globals, locals, fromlist, level)
+        if len(sys.modules) == loaded and self.events and self.events[-1] is event:
+            #Already imported, nothing to report.
+            self.events.pop()
+        return module
+
+    @contextmanager
+    def span(self, kind, name):
+        """Time the body of a with block as an event of kind, like
+        "import", "asset" or "state"."""
+        if not self.enabled:
+            yield None
+            return
+        event = {"kind": kind, "name": name, "depth": self.depth,
+                 "start": default_timer() - self.start, "duration": 0.0}
+        self.events.append(event)
+        self.depth += 1
+        try:
+            yield event
+        finally:
+            self.depth -= 1
+            event["duration"] = default_timer() - self.start - event["start"]
+
+    def first_frame(self):
+        """Called by Control after each of the first frames is shown; the
+        first call records time-to-first-frame and prints the report."""
+        if self.first_frame_time is not None or not self.enabled:
+            return
+        self.first_frame_time = default_timer() - self.start
+        self.disable()
+        self.print_report()
+
+    def print_report(self, stream=None, min_ms=1.0):
+        """Write the events that took at least min_ms to stream."""
+        stream = stream if stream is not None else sys.stderr
+        stream.write("Startup trace (ms since start, duration)\n")
+        for event in self.events:
+            if event["duration"] * 1000 < min_ms:
+                continue
+            stream.write("{:9.1f} {:9.1f}  {}{:<7} {}\n".format(
+                    event["start"] * 1000, event["duration"] * 1000,
+                    "  " * event["depth"], event["kind"], event["name"]))
+        if self.first_frame_time is not None:
+            stream.write("First frame shown after {:.1f} ms\n".format(
+                    self.first_frame_time * 1000))
+
+
+TRACER = StartupTracer()
+
+if os.environ.get("WORDBLASTER_TRACE_STARTUP"):
+    TRACER.enable()
@@ -4,6 +4,7 @@ import pygame as pg
 
 from .. import tools, prepare
 from ..components.labels import Label, Blinker
+from ..components.game_objects import get_background
 
 def zfill(num):
     if num < 10:
@@ -30,8 +31,6 @@ class GameOverScreen(tools._State):
         self.bold = prepare.FONTS["Xolonium-Bold"]
         self.colors = [prepare.GFX["ship{}".format(x)].get_at((0, 112))
                             for x in range(7)]
-        self.hills = prepare.GFX["hills"]
-        self.hills_rect = self.hills.get_rect(bottomleft=prepare.SCREEN_RECT.bottomleft)
         
     def startup(self, persistent):
         sr = prepare.SCREEN_RECT
@@ -41,7 +40,7 @@ class GameOverScreen(tools._State):
         num_chars = "{}".format(self.persist["num chars"])
         num_words = "{}".format(self.persist["num words"])
         wpm = (self.persist["num chars"] / 5.) / (game_time / 60000.)
-        self.stars = self.persist["stars"]
+        self.background = get_background(self.persist)
         self.blinkers = pg.sprite.Group()
         self.title = Blinker("Game Over", {"midtop": (sr.centerx, 20)},
                                   600, self.blinkers, font_size=96, font_path=self.bold,
@@ -85,15 +84,20 @@ class GameOverScreen(tools._State):
             self.title.text_color = choice(self.colors)
             self.title.update_text()
         self.prompt.update(dt)
-        for star in self.stars:
-            star.update(dt)
+        self.background.update(dt)
 
-    def draw(self, surface):
-        surface.fill(pg.Color("black"))
-        for star in self.stars:
-            star.draw(surface)
-        surface.blit(self.hills, self.hills_rect)
+    def draw(self, surface, alpha=1.0):
+        self.background.draw(surface, self.dirty)
         self.title.draw(surface)
         self.labels.draw(surface)
         self.prompt.draw(surface)
-        
\ No newline at end of file
+        self.dirty.add(self.title.rect)
+        self.dirty.add(self.prompt.rect)
+        for label in self.labels:
+            self.dirty.add(label.rect)
+
+    def display_changed(self):
+        self.background.invalidate()
+
+    def get_dirty_rects(self):
+        return self.dirty.flush(prepare.SCREEN_RECT)
@@ -1,15 +1,25 @@
 from math import pi, degrees
-from random import randint, choice
 from itertools import cycle
+from functools import partial
 
 import pygame as pg
 
 from .. import tools, prepare
 from ..components.labels import Label, MultiLineLabel, Textbox
-from ..components.word_generator import load_words
+from ..components.word_generator import get_sampler, get_definitions
 from ..components.angles import get_angle, get_distance
-from ..components.animation import Animation
-from ..components.game_objects import Star, Word, Turret, Lazer
+from ..components.animation import AnimationManager
+from ..components.game_objects import Word, Turret, Lazer, get_background
+from ..components.matcher import make_matcher
+from ..components.preloader import PRELOADER, read_file
+
+
+#word frequency, max word length, word speed, length bias
+DIFFICULTIES = {
+        "Easy": (4500, 8, .02, 0),
+        "Normal": (3500, 10, .025, 0),
+        "Hard": (3000, 12, .03, 0),
+        "Insane": (2500, 12, .05, 0)}
 
 
 def zfill(num):
@@ -31,20 +41,26 @@ def time_format(milliseconds):
         return ":{}".format(zfill(seconds))
 
 
+def preload():
+    """
+    Start loading the word samplers for every difficulty and reading the
+    game music in the background. Gameplay.new_game picks up the samplers,
+    the music read just leaves the file in the OS cache.
+    """
+    for settings in DIFFICULTIES.values():
+        max_length, length_bias = settings[1], settings[3]
+        PRELOADER.submit(("sampler", max_length, length_bias),
+                         get_sampler, max_length, length_bias)
+    PRELOADER.submit("music", read_file, prepare.MUSIC["game"])
+
+
 class Gameplay(tools._State):
     def __init__(self):
         super(Gameplay, self).__init__()
-        sr = prepare.SCREEN_RECT
         self.song = prepare.MUSIC["game"]
-        self.hills = prepare.GFX["hills"]
-        self.hills_rect = self.hills.get_rect(bottomleft=sr.bottomleft)
-        self.dashboard = prepare.GFX["dashboard"]
-        self.dash_rect = self.dashboard.get_rect(bottomleft=sr.bottomleft)
-        self.difficulties = {
-                "Easy": (4500, 8, .02),
-                "Normal": (3500, 10, .025),
-                "Hard": (3000, 12, .03),
-                "Insane": (2500, 12, .05)}
+        self.difficulties = DIFFICULTIES
+        #Use the NumPy matcher, worthwhile with hundreds of words on screen
+        self.vectorized_matching = False
 
     def new_game(self, difficulty):
         sr = prepare.SCREEN_RECT
@@ -55,18 +71,22 @@ class Gameplay(tools._State):
         self.turret = Turret((sr.centerx, sr.bottom - 65))
         self.word_speed = .02
         self.word_timer = 0
-        self.word_frequency, max_length, self.word_speed = self.difficulties[difficulty]
-        self.words_dict = load_words(max_length)
+        settings = self.difficulties[difficulty]
+        self.word_frequency, max_length, self.word_speed, length_bias = settings
+        self.sampler = PRELOADER.result(("sampler", max_length, length_bias),
+                                        get_sampler, max_length, length_bias)
+        self.definitions = get_definitions()
         self.words = pg.sprite.Group()
+        self.matcher = make_matcher(self.vectorized_matching)
         self.make_word_spots()
         self.add_random_word()
         self.points = 0
         self.num_solved = 0
         self.game_time = 0
-        self.animations = pg.sprite.Group()
+        self.animations = AnimationManager()
         self.lazers = pg.sprite.Group()
-        self.stars = [Star((randint(1, sr.right), randint(1, sr.bottom - 150)))
-                           for _ in range(100)]
+        #preload's read of the song only warms the OS cache, so it isn't
+        #waited for. If it hasn't finished or failed, load does its own I/O.
         pg.mixer.music.load(self.song)
         pg.mixer.music.play(-1)
         self.def_label = None
@@ -74,6 +94,10 @@ class Gameplay(tools._State):
 
     def startup(self, persistent):
         self.persist = persistent
+        #The lazer isn't drawn until the first shot, load it now instead
+        prepare.GFX.preload(["dish", "dish_base", "lazer"])
+        prepare.SFX.preload(["lazer"])
+        self.background = get_background(self.persist)
         difficulty = self.persist["difficulty"]
         self.new_game(difficulty)
 
@@ -83,24 +107,21 @@ class Gameplay(tools._State):
         self.word_spots = cycle(spots)
 
     def add_random_word(self):
-        text = choice(self.words_dict.keys())
+        text = self.sampler.sample()
         pos = next(self.word_spots)
-        Word(text, pos, self.word_speed, self.words)
+        word = Word(text, pos, self.word_speed, self.words)
+        self.matcher.add(word)
 
     def closest_match(self):
-        entered = self.textbox.buffer
-        closest = None, 0
-        for word in self.words:
-            score = 0
-            for char, entered_char in zip(word.word, entered):
-                if char == entered_char:
-                    score += 1
-            if score > closest[1]:
-                closest = word, score
-        return closest[0]
+        self.matcher.set_buffer(self.textbox.buffer)
+        return self.matcher.closest()
+
+    def lazer_hit(self, lazer):
+        self.matcher.remove(lazer.word)
+        lazer.die()
 
     def make_definition(self, word):
-        defined = self.words_dict[word]
+        defined = self.definitions.get(word)
         try:
             text = "{}: {}".format(word.upper(), defined)
         except:
@@ -133,7 +154,6 @@ class Gameplay(tools._State):
         self.persist["game time"] = self.game_time
         self.persist["num words"] = self.num_solved
         self.persist["num chars"] = self.points
-        self.persist["stars"] = self.stars
 
     def get_event(self,event):
         if event.type == pg.QUIT:
@@ -144,10 +164,10 @@ class Gameplay(tools._State):
         self.textbox.get_event(event)
 
     def update(self, dt):
+        self.lazers.update(dt)
         self.animations.update(dt)
         self.game_time += dt
-        for star in self.stars:
-            star.update(dt)
+        self.background.update(dt)
         self.word_timer += dt
         if self.word_timer >= self.word_frequency:
             self.word_timer -= self.word_frequency
@@ -166,38 +186,43 @@ class Gameplay(tools._State):
         self.time_label.set_text(time_format(self.game_time))
 
         if self.textbox.final:
-            for word in self.words:
-                if self.textbox.final == word.word:
-                    self.num_solved += 1
-                    self.points += len(word.word)
-                    self.words_label.set_text("{}".format(self.num_solved))
-                    self.chars_label.set_text("{}".format(self.points))
-                    self.make_definition(word.word)
-                    self.turret.shoot(word)
-                    lazer = Lazer(self.turret.rect.center, word, self.lazers)
-                    dist = float(get_distance(self.turret.rect.center, 
-                                                          word.rect.center))
-                    ani = Animation(centerx=word.rect.centerx,
-                                            centery=word.rect.centery,
-                                            duration=dist, round_values=True)
-                    ani.start(lazer.rect)
-                    ani.callback = lazer.die
-                    self.animations.add(ani)
+            for word in self.matcher.exact_matches(self.textbox.final):
+                self.num_solved += 1
+                self.points += len(word.word)
+                self.words_label.set_text("{}".format(self.num_solved))
+                self.chars_label.set_text("{}".format(self.points))
+                self.make_definition(word.word)
+                self.turret.shoot(word)
+                lazer = Lazer(self.turret.rect.center, word, self.lazers)
+                dist = float(get_distance(self.turret.rect.center,
+                                          word.rect.center))
+                ani = self.animations.animate(lazer.rect,
+                                              centerx=word.rect.centerx,
+                                              centery=word.rect.centery,
+                                              duration=dist, round_values=True)
+                ani.callback = partial(self.lazer_hit, lazer)
             self.textbox.clear()
 
-    def draw(self, surface):
-        surface.fill(pg.Color("black"))
-        for star in self.stars:
-            star.draw(surface)
-        surface.blit(self.hills, self.hills_rect)
+    def draw(self, surface, alpha=1.0):
+        self.background.draw(surface, self.dirty, dashboard=True)
         for word in self.words:
-            word.draw(surface)
-        self.lazers.draw(surface)
-        self.turret.draw(surface)
-        surface.blit(self.dashboard, self.dash_rect)
+            self.dirty.add(word.draw(surface, alpha))
+        covered = [lazer.draw(surface, alpha) for lazer in self.lazers]
+        covered.append(self.turret.draw(surface, alpha))
+        for rect in covered:
+            self.dirty.add(rect)
+        self.background.draw_dashboard(surface, covered)
         self.textbox.draw(surface)
+        self.dirty.add(self.textbox.rect)
         if self.def_label is not None:
             self.def_label.draw(surface)
+            self.dirty.add(self.def_label.rect)
         self.labels.draw(surface)
+        for label in self.labels:
+            self.dirty.add(label.rect)
 
+    def display_changed(self):
+        self.background.invalidate()
 
+    def get_dirty_rects(self):
+        return self.dirty.flush(prepare.SCREEN_RECT)
@@ -1,10 +1,9 @@
-from random import randint
-
 import pygame as pg
 
-from .. import tools, prepare
+from .. import tools, prepare, replay
 from ..components.labels import Label, Button, ButtonGroup
-from ..components.game_objects import Star, Word, MaskedButton
+from ..components.game_objects import Word, MaskedButton, get_background
+from .gameplay import preload
 
 
 class TitleScreen(tools._State):
@@ -13,15 +12,12 @@ class TitleScreen(tools._State):
         self.difficulty = "Easy"
         self.font = prepare.FONTS["Xolonium-Regular"]
         self.bold = prepare.FONTS["Xolonium-Bold"]
-        self.hills = prepare.GFX["hills"]
-        self.hills_rect = self.hills.get_rect(bottomleft=prepare.SCREEN_RECT.bottomleft)
         self.reset()
+        preload()
 
 
     def reset(self):
-        sr = prepare.SCREEN_RECT
-        self.stars = [Star((randint(1, sr.right), randint(1, sr.bottom - 150)))
-                           for _ in range(100)]
+        self.background = get_background(self.persist)
         self.make_buttons()
         pg.mouse.set_pos(self.button_centers[self.button_index])
 
@@ -57,6 +53,7 @@ class TitleScreen(tools._State):
     def startup(self, persistent):
         self.persist = persistent
         self.reset()
+        preload()
 
     def get_event(self,event):
         if event.type == pg.QUIT:
@@ -75,13 +72,17 @@ class TitleScreen(tools._State):
         self.buttons.get_event(event)
 
     def update(self, dt):
-        self.buttons.update(dt, pg.mouse.get_pos())
-        for star in self.stars:
-            star.update(dt)
+        self.buttons.update(dt, replay.INPUT.mouse_pos)
+        self.background.update(dt)
+
+    def draw(self, surface, alpha=1.0):
+        self.background.draw(surface, self.dirty)
+        self.buttons.draw(surface)
+        for button in self.buttons:
+            self.dirty.add(button.rect)
+
+    def display_changed(self):
+        self.background.invalidate()
 
-    def draw(self, surface):
-        surface.fill(pg.Color("black"))
-        for star in self.stars:
-            star.draw(surface)
-        surface.blit(self.hills, self.hills_rect)
-        self.buttons.draw(surface)
\ No newline at end of file
+    def get_dirty_rects(self):
+        return self.dirty.flush(prepare.SCREEN_RECT)
@@ -5,9 +5,13 @@ for States.  Also contained here are resource loading functions.
 
 import os
 import copy
+from collections import OrderedDict
 
 import pygame as pg
 
+from . import profiling, replay
+from .startup import TRACER
+
 
 class Control(object):
     """Control class for entire project. Contains the game loop, and contains
@@ -19,6 +23,9 @@ class Control(object):
         self.done = False
         self.clock = pg.time.Clock()
         self.fps = 60.
+        self.time_step = 1000 / 60.
+        self.max_steps = 5
+        self.accumulator = 0.0
         self.show_fps = False
         self.current_time = 0.0
         self.keys = pg.key.get_pressed()
@@ -26,13 +33,30 @@ class Control(object):
         self.state_name = None
         self.state = None
         self.fullscreen = False
+        self.dirty_rendering = False
+        self.full_update = True
+        self.recorder = profiling.FrameRecorder()
+        self.overlay = profiling.FrameOverlay(self.recorder)
+        self.show_overlay = False
+        self.stats_path = "frame_stats.json"
 
     def setup_states(self, state_dict, start_state):
         """Given a dictionary of States and a State to start in,
-        builds the self.state_dict."""
+        builds the self.state_dict. Instead of a State a value can be a
+        State class or other function returning a State, which is called
+        the first time the State is needed."""
         self.state_dict = state_dict
         self.state_name = start_state
-        self.state = self.state_dict[self.state_name]
+        self.state = self.get_state(self.state_name)
+
+    def get_state(self, name):
+        """Return the State called name, making it if necessary."""
+        state = self.state_dict[name]
+        if not isinstance(state, _State):
+            with TRACER.span("state", name):
+                state = state()
+            self.state_dict[name] = state
+        return state
 
     def update(self, dt):
         """Checks if a state is done or has called for a game quit.
@@ -44,26 +68,64 @@ class Control(object):
         elif self.state.done:
             self.flip_state()
         self.state.update(dt)
-        self.state.draw(self.screen)
+
+    def simulate(self, frame_time):
+        """Advance the game by frame_time milliseconds in fixed steps of
+        self.time_step. Time that doesn't fill a whole step carries over
+        to the next frame. At most self.max_steps are run per frame, any
+        time beyond that is dropped so a slow frame can't snowball."""
+        self.accumulator += frame_time
+        steps = 0
+        while self.accumulator >= self.time_step and steps < self.max_steps:
+            self.update(self.time_step)
+            self.accumulator -= self.time_step
+            steps += 1
+        if self.accumulator >= self.time_step:
+            self.accumulator %= self.time_step
+
+    def draw(self):
+        """Draw the current State to the screen, passing how far (0 to 1)
+        the game is between the last update and the next one so moving
+        objects can be drawn in between."""
+        if self.full_update:
+            self.state.dirty.full = True
+        self.state.draw(self.screen, self.accumulator / self.time_step)
+
+    def present(self):
+        """Push the frame to the display. In dirty rendering mode only the
+        areas the State reported as changed are updated."""
+        rects = self.state.get_dirty_rects()
+        if self.dirty_rendering and not self.full_update and rects is not None:
+            pg.display.update(rects)
+        else:
+            pg.display.update()
+        self.full_update = False
 
     def flip_state(self):
         """When a State changes to done necessary startup and cleanup functions
         are called and the current State is changed."""
         previous,self.state_name = self.state_name, self.state.next
         persist = self.state.cleanup()
-        self.state = self.state_dict[self.state_name]
+        self.state = self.get_state(self.state_name)
         self.state.startup(persist)
         self.state.previous = previous
+        self.full_update = True
 
     def event_loop(self):
         """Process all events and pass them down to current State.  The f5 key
-        globally turns on/off the display of FPS in the caption"""
-        for event in pg.event.get():
+        globally turns on/off the display of FPS in the caption, f6 turns
+        dirty rect rendering on/off, f7 shows the frame timing graph and
+        f8 saves the recorded frame timings. Events come from replay.INPUT
+        so they can be recorded or played back."""
+        for event in replay.INPUT.get_events():
             if event.type == pg.QUIT:
                 self.done = True
             elif event.type == pg.KEYDOWN:
                 self.keys = pg.key.get_pressed()
                 self.toggle_show_fps(event.key)
+                self.toggle_dirty_rendering(event.key)
+                self.toggle_overlay(event.key)
+                self.dump_stats(event.key)
             elif event.type == pg.KEYUP:
                 self.keys = pg.key.get_pressed()
                 self.toggle_fullscreen(event.key)
@@ -76,6 +138,24 @@ class Control(object):
             if not self.show_fps:
                 pg.display.set_caption(self.caption)
 
+    def toggle_dirty_rendering(self, key):
+        """Press f6 to turn on/off updating only the changed parts of
+        the display."""
+        if key == pg.K_F6:
+            self.dirty_rendering = not self.dirty_rendering
+            self.full_update = True
+
+    def toggle_overlay(self, key):
+        """Press f7 to turn on/off the frame timing graph."""
+        if key == pg.K_F7:
+            self.show_overlay = not self.show_overlay
+            self.full_update = True
+
+    def dump_stats(self, key):
+        """Press f8 to save the recorded frame timings to stats_path."""
+        if key == pg.K_F8:
+            self.recorder.dump(self.stats_path)
+
     def toggle_fullscreen(self, key):
         if key == pg.K_F1:
             screen_size = pg.display.get_surface().get_size()
@@ -84,14 +164,26 @@ class Control(object):
                 self.screen = pg.display.set_mode(screen_size, pg.FULLSCREEN)
             else:
                 self.screen = pg.display.set_mode(screen_size)
+            self.state.display_changed()
+            self.full_update = True
 
     def main(self):
         """Main loop for entire program."""
         while not self.done:
-            time_delta = self.clock.tick(self.fps)
-            self.event_loop()
-            self.update(time_delta)
-            pg.display.update()
+            time_delta = replay.INPUT.frame_time(self.clock.tick(self.fps))
+            recorder = self.recorder
+            recorder.begin_frame()
+            recorder.time("event_loop", self.event_loop)
+            recorder.time("update", self.simulate, time_delta)
+            recorder.time("draw", self.draw)
+            if self.show_overlay:
+                self.overlay.draw(self.screen)
+                self.state.dirty.add(self.overlay.rect)
+            recorder.time("present", self.present)
+            recorder.end_frame()
+            TRACER.first_frame()
+            if replay.INPUT.finished:
+                self.done = True
             if self.show_fps:
                 fps = self.clock.get_fps()
                 with_fps = "{} - {:.2f} FPS".format(self.caption, fps)
@@ -111,6 +203,7 @@ class _State(object):
         self.next = None
         self.previous = None
         self.persist = {}
+        self.dirty = DirtyRects()
 
     def get_event(self, event):
         """Processes events that were passed from the main event loop.
@@ -133,9 +226,23 @@ class _State(object):
         """Update function for state.  Must be overloaded in children."""
         pass
 
-    def draw(self, surface):
+    def draw(self, surface, alpha=1.0):
+        """Draw function for state. alpha is the fraction of a time step
+        that has passed since the last update, for drawing moving objects
+        between their previous and current positions."""
+        pass
+
+    def display_changed(self):
+        """Called after the display mode changes. Overload to rebuild
+        anything that was converted to the old display format."""
         pass
-        
+
+    def get_dirty_rects(self):
+        """Return a list of the screen areas changed by the last draw,
+        or None if the whole screen should be updated. States that mark
+        what they draw in self.dirty can return self.dirty.flush()."""
+        return None
+
     def render_font(self, font, msg, color, center):
         """Returns the rendered font surface and its rect centered on center."""
         msg = font.render(msg, 1, color)
@@ -143,6 +250,38 @@ class _State(object):
         return msg, rect
 
 
+class DirtyRects(object):
+    """
+    Collects the screen areas a State drew to during a frame. flush
+    returns them along with the previous frame's areas, so that places
+    something moved away from get updated too. full is True when the
+    whole screen has to be redrawn this frame, like after a state change,
+    rather than only the areas in previous.
+    """
+    def __init__(self):
+        self.current = []
+        self.previous = []
+        self.full = True
+
+    def add(self, rect):
+        self.current.append(pg.Rect(rect))
+
+    def flush(self, bounds=None):
+        """Return this frame's and last frame's areas, clipped to bounds
+        if given, and start a new frame."""
+        rects = self.previous + self.current
+        self.previous, self.current = self.current, []
+        self.full = False
+        if bounds is not None:
+            rects = [r.clip(bounds) for r in rects]
+        return rects
+
+    def clear(self):
+        self.current = []
+        self.previous = []
+        self.full = True
+
+
 class _KwargMixin(object):
     """
     Useful for classes that require a lot of keyword arguments for
@@ -168,23 +307,90 @@ class _KwargMixin(object):
             setattr(self, setting, settings[setting])
 
 
+class LRUCache(object):
+    """
+    A dict-like cache holding at most max_size items. When full, the
+    least recently used item is discarded to make room for a new one.
+    The hits and misses attributes count the results of get calls.
+
+    If sizeof is given it should be a function returning the size in bytes
+    of a cached value. The running total is kept in the nbytes attribute
+    and, if max_bytes is also given, items are discarded until the total
+    fits within it.
+    """
+    def __init__(self, max_size=128, max_bytes=None, sizeof=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.items = OrderedDict()
+        self.sizes = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it as most recently used."""
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.items[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.discard(key)
+        self.items[key] = value
+        if self.sizeof is not None:
+            self.sizes[key] = self.sizeof(value)
+            self.nbytes += self.sizes[key]
+        while len(self.items) > 1 and (len(self.items) > self.max_size or
+                (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            self.discard(next(iter(self.items)))
+            self.evictions += 1
+
+    def discard(self, key):
+        """Remove key from the cache if it's present."""
+        self.items.pop(key, None)
+        self.nbytes -= self.sizes.pop(key, 0)
+
+    def clear(self):
+        self.items.clear()
+        self.sizes.clear()
+        self.nbytes = 0
+
+
 ### Resource loading functions.
+def load_image(path, colorkey=(0,0,0)):
+    """Load an image. If alpha transparency is found in the image the image
+    will be converted using convert_alpha().  If no alpha transparency is
+    detected image will be converted using convert() and colorkey will be
+    set to colorkey."""
+    img = pg.image.load(path)
+    if img.get_alpha():
+        img = img.convert_alpha()
+    else:
+        img = img.convert()
+        img.set_colorkey(colorkey)
+    return img
+
+
 def load_all_gfx(directory,colorkey=(0,0,0),accept=(".png",".jpg",".bmp")):
-    """Load all graphics with extensions in the accept argument.  If alpha
-    transparency is found in the image the image will be converted using
-    convert_alpha().  If no alpha transparency is detected image will be
-    converted using convert() and colorkey will be set to colorkey."""
+    """Load all graphics with extensions in the accept argument. See
+    load_image."""
     graphics = {}
     for pic in os.listdir(directory):
         name,ext = os.path.splitext(pic)
         if ext.lower() in accept:
-            img = pg.image.load(os.path.join(directory, pic))
-            if img.get_alpha():
-                img = img.convert_alpha()
-            else:
-                img = img.convert()
-                img.set_colorkey(colorkey)
-            graphics[name]=img
+            graphics[name] = load_image(os.path.join(directory, pic), colorkey)
     return graphics
 
 
@@ -223,6 +429,84 @@ def load_all_sfx(directory, accept=(".wav", ".mp3", ".ogg", ".mdi")):
     return effects
 
 
+class AssetRegistry(object):
+    """
+    A read-only dict of assets that loads each one the first time it's
+    looked up. Only the file names are read when the registry is made.
+    preload loads assets ahead of time without counting them as used;
+    touched holds the names that have been looked up, for report.
+    """
+    def __init__(self, paths, loader, *args):
+        self.paths = paths
+        self.loader = loader
+        self.args = args
+        self.assets = {}
+        self.touched = set()
+
+    def __getitem__(self, name):
+        self.touched.add(name)
+        try:
+            return self.assets[name]
+        except KeyError:
+            return self.load(name)
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def keys(self):
+        return list(self.paths)
+
+    def get(self, name, default=None):
+        if name not in self.paths:
+            return default
+        return self[name]
+
+    def load(self, name):
+        if name not in self.assets:
+            with TRACER.span("asset", self.paths[name]):
+                self.assets[name] = self.loader(self.paths[name], *self.args)
+        return self.assets[name]
+
+    def preload(self, names=None):
+        """Load the assets in names, or all of them if names is None."""
+        for name in (self.paths if names is None else names):
+            self.load(name)
+
+    def report(self):
+        """Return which assets have been used, loaded and never used."""
+        return {"touched": sorted(self.touched),
+                "loaded": sorted(self.assets),
+                "unused": sorted(set(self.paths) - self.touched)}
+
+
+def lazy_gfx(directory, colorkey=(0,0,0), accept=(".png",".jpg",".bmp"),
+             bundle=None):
+    """An AssetRegistry of the graphics in directory. See load_image. If
+    an AssetBundle is given the images in it are loaded from it, any
+    others from their files."""
+    paths = load_all_music(directory, accept)
+    if bundle is not None:
+        paths.update(bundle.listing(directory))
+        return AssetRegistry(paths, bundle.load_image, colorkey)
+    return AssetRegistry(paths, load_image, colorkey)
+
+
+def lazy_sfx(directory, accept=(".wav", ".mp3", ".ogg", ".mdi"), bundle=None):
+    """An AssetRegistry of the sound effects in directory, loaded from
+    bundle if one is given and has them."""
+    paths = load_all_music(directory, accept)
+    if bundle is not None:
+        paths.update(bundle.listing(directory))
+        return AssetRegistry(paths, bundle.load_sound)
+    return AssetRegistry(paths, pg.mixer.Sound)
+
+
 def strip_from_sheet(sheet, start, size, columns, rows=1):
     """Strips individual frames from a sprite sheet given a start location,
     sprite size, and number of columns and rows."""
@@ -0,0 +1,76 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from data.components import animation
+from data.components.animation import AnimationManager
+
+
+class Target(object):
+    def __init__(self):
+        self.x = 0.
+
+
+def run_retarget(count):
+    """Tween count targets to 100, retarget them to 20 after 50 ms and
+    return their x values 10 ms later."""
+    manager = AnimationManager()
+    targets = [Target() for _ in range(count)]
+    for target in targets:
+        manager.animate(target, x=100, duration=100)
+    manager.update(50)
+    for target in targets:
+        manager.animate(target, x=20, duration=100)
+    manager.update(10)
+    return [target.x for target in targets]
+
+
+def test_retarget_restarts_tween():
+    assert run_retarget(1) == [47.]
+
+
+def test_retarget_batched_matches_scalar():
+    count = AnimationManager.min_batch + 4
+    assert run_retarget(count) == run_retarget(1) * count
+
+
+def test_lookup_tables_only_batch_expensive_transitions():
+    animation.use_lookup_tables(64)
+    try:
+        assert "out_elastic" in animation.LOOKUP_TABLES
+        assert "out_quad" not in animation.LOOKUP_TABLES
+        manager = AnimationManager()
+        ani = manager.animate(Target(), x=100, transition="out_elastic")
+        assert ani._transition is animation.AnimationTransition.out_elastic
+        table = animation.LOOKUP_TABLES["out_elastic"]
+        assert animation.vectorize_transition(ani._transition) == table.vectorized
+    finally:
+        animation.use_lookup_tables(0)
+
+
+def run_overlapping(seed, min_batch):
+    """Tween a few targets with overlapping Animations added straight to
+    a manager and return their x values after every update."""
+    rng = random.Random(seed)
+    manager = AnimationManager()
+    manager.min_batch = min_batch
+    targets = [Target() for _ in range(3)]
+    frames = []
+    for _ in range(60):
+        if rng.random() < .3:
+            ani = animation.Animation(x=rng.randint(-200, 200),
+                                      duration=rng.randint(20, 200),
+                                      transition=rng.choice(["linear", "out_quad"]))
+            ani.start(rng.choice(targets))
+            manager.add(ani)
+        manager.update(rng.randint(5, 40))
+        frames.append([target.x for target in targets])
+    return frames
+
+
+def test_overlapping_batched_matches_scalar():
+    for seed in range(10):
+        assert run_overlapping(seed, 1) == run_overlapping(seed, 1000)
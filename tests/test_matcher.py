@@ -0,0 +1,77 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.components import matcher
+from data.components.angles import get_angle
+
+
+class Word(object):
+    def __init__(self, word, center):
+        self.word = word
+        self.center = center
+
+
+def closest_match(words, entered):
+    """The scoring loop Gameplay used before the matchers."""
+    closest = None, 0
+    for word in words:
+        score = 0
+        for char, entered_char in zip(word.word, entered):
+            if char == entered_char:
+                score += 1
+        if score > closest[1]:
+            closest = word, score
+    return closest[0]
+
+
+def random_text(rng, max_length=6):
+    #A small alphabet so scores tie often
+    return "".join(rng.choice("abc") for _ in range(rng.randint(1, max_length)))
+
+
+def check_matcher(make, seed):
+    """Add, remove and type at random, checking make()'s results against
+    the old loops after every change."""
+    rng = random.Random(seed)
+    found = make()
+    words = []
+    buffer = ""
+    for _ in range(300):
+        roll = rng.random()
+        if roll < .3 or not words:
+            word = Word(random_text(rng), (rng.randint(0, 1280), rng.randint(0, 600)))
+            words.append(word)
+            found.add(word)
+        elif roll < .45:
+            word = words.pop(rng.randrange(len(words)))
+            found.remove(word)
+        elif roll < .75:
+            buffer += rng.choice("abc")
+        elif roll < .9:
+            buffer = buffer[:-1]
+        else:
+            buffer = random_text(rng, 8)
+        found.set_buffer(buffer)
+        expected = closest_match(words, buffer)
+        assert found.closest() is expected
+        if expected is not None:
+            turret = (rng.randint(0, 1280), rng.randint(600, 720))
+            assert (get_angle(turret, found.closest().center) ==
+                    get_angle(turret, expected.center))
+        text = random_text(rng, 4)
+        assert found.exact_matches(text) == [w for w in words if w.word == text]
+
+
+def test_word_matcher_matches_scoring_loop():
+    for seed in range(10):
+        check_matcher(matcher.WordMatcher, seed)
+
+
+def test_array_matcher_matches_scoring_loop():
+    if matcher.np is None:
+        return
+    for seed in range(10):
+        check_matcher(lambda: matcher.ArrayMatcher(capacity=4, width=2), seed)
@@ -0,0 +1,54 @@
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame as pg
+
+from data.components.surface_cache import SurfaceCache
+
+
+def make_cache():
+    pg.display.init()
+    if pg.display.get_surface() is None:
+        pg.display.set_mode((16, 16))
+    directory = tempfile.mkdtemp()
+    resources = os.path.join(directory, "resources")
+    os.makedirs(resources)
+    return SurfaceCache(os.path.join(directory, "cache"), resources), directory
+
+
+def test_load_returns_saved_surface():
+    cache, directory = make_cache()
+    try:
+        surface = pg.Surface((7, 5), pg.SRCALPHA)
+        surface.fill((10, 20, 30, 40))
+        surface.set_at((6, 4), (200, 100, 50, 255))
+        cache.save(("test", 1), surface)
+        for _ in range(2):
+            loaded = cache.load(("test", 1))
+            assert loaded.get_size() == (7, 5)
+            assert tuple(loaded.get_at((0, 0))) == (10, 20, 30, 40)
+            assert tuple(loaded.get_at((6, 4))) == (200, 100, 50, 255)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_get_makes_surface_once():
+    cache, directory = make_cache()
+    made = []
+    def make():
+        made.append(1)
+        return pg.Surface((3, 3), pg.SRCALPHA)
+    try:
+        cache.get("key", make)
+        cache.get("key", make)
+        assert len(made) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.load("missing") is None
+    finally:
+        shutil.rmtree(directory)
@@ -1,11 +1,27 @@
 #!/usr/bin/python2
 
 import sys
-import pygame as pg
-from data.main import main
+import argparse
+from data.startup import TRACER
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", metavar="FILE",
+                        help="save the session's input to FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play back the input recorded in FILE")
+    parser.add_argument("--trace-startup", action="store_true",
+                        help="print how long imports, asset loads and states "
+                             "take until the first frame")
+    parser.add_argument("--count-allocations", action="store_true",
+                        help="count the Surfaces made each frame for the "
+                             "frame overlay (slows the game down)")
+    args = parser.parse_args()
+    if args.trace_startup:
+        TRACER.enable()
+    import pygame as pg
+    from data.main import main
+    main(args.record, args.replay, args.count_allocations)
     pg.quit()
-    sys.exit()
\ No newline at end of file
+    sys.exit()